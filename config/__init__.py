@@ -4,11 +4,27 @@
 # from .db_client import get_client
 # from .collection_manager import get_or_create_collection
 # from .doc_loader import insert_docs
-from .db_client import get_chroma_client
-from .collection_manager import CollectionManager
-from .doc_loader import DocLoader
 # from ..index_docs import index_documents
 # from ..index_docs import index_documents_from_directory
 
+import importlib
 
+# Resolved on first access (PEP 562) so `import config.registry` and friends
+# don't drag in chromadb / numpy / the doc loader at process start
+_EXPORTS = {
+    "get_chroma_client": ".db_client",
+    "get_embedder": ".registry",
+    "startup_report": ".registry",
+    "CollectionManager": ".collection_manager",
+    "DocLoader": ".doc_loader",
+}
 
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+
+from .db_client import CHROMA_DB_PATH
+
+ALIASES_PATH = os.path.join(CHROMA_DB_PATH, "aliases.json")
+
+_lock = threading.Lock()
+
+
+def _read(path: str = ALIASES_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable alias file {path}: {e}")
+        return {}
+
+
+def resolve_collection(name: str, path: str = ALIASES_PATH) -> str:
+    """
+    Physical collection an alias currently points at.
+
+    Names without an alias entry are physical names already, so code that
+    has never swapped an index keeps using its collection unchanged.
+    """
+    return _read(path).get(name, name)
+
+
+def aliases_version(path: str = ALIASES_PATH) -> int:
+    """Changes whenever any alias is repointed; cheap enough to check per request"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def set_alias(alias: str, collection_name: str, path: str = ALIASES_PATH) -> str:
+    """Point alias at collection_name; returns the collection it pointed at before"""
+    with _lock:
+        aliases = _read(path)
+        previous = aliases.get(alias, alias)
+        aliases[alias] = collection_name
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(aliases, f, indent=2, sort_keys=True)
+        # Atomic replace: readers see either the old or the new target, never neither
+        os.replace(tmp_path, path)
+    return previous
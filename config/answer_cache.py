@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def doc_signature(sources) -> tuple:
+    """
+    Identity of a retrieved doc set: (path, chunk, content hash) per source.
+    Any edit to a retrieved doc changes its content hash, so the signature
+    changes with it.
+    """
+    signature = []
+    for s in sources:
+        meta = s.get("metadata", {}) or {}
+        signature.append((
+            meta.get("path", s.get("filename", "")),
+            meta.get("chunk_index", 0),
+            meta.get("content_hash", "")
+        ))
+    return tuple(signature)
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers looked up by query-embedding similarity.
+
+    A cached answer is reused when a new query's embedding has cosine
+    similarity >= threshold with a cached query AND retrieval returned the
+    same doc set for it. invalidate() drops everything, e.g. after the
+    collection changes.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512, ttl_seconds: float = 86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # id -> (unit vector, signature, value, stored_at)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_embedding, signature: tuple):
+        """Return the cached value for the closest matching query, or None"""
+        query = self._unit(query_embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            expired = [
+                key for key, (_, _, _, stored_at) in self._entries.items()
+                if self.ttl_seconds and now - stored_at > self.ttl_seconds
+            ]
+            for key in expired:
+                del self._entries[key]
+
+            candidates = [
+                (key, entry) for key, entry in self._entries.items() if entry[1] == signature
+            ]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            matrix = np.vstack([entry[0] for _, entry in candidates])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return {**entry[2], "similarity": float(similarities[best])}
+
+    def store(self, query_embedding, signature: tuple, value: dict):
+        with self._lock:
+            self._entries[self._next_id] = (
+                self._unit(query_embedding), signature, value, time.monotonic()
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations
+        }
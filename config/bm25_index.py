@@ -0,0 +1,253 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from .db_client import CHROMA_DB_PATH
+from .vector_index import matches_where, scoped_sections
+
+DEFAULT_BM25_DIR = os.path.join(CHROMA_DB_PATH, "bm25")
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+# OnRowClick -> On Row Click, HTTPRequest -> HTTP Request, row2Col -> row 2 Col
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercased word tokens. Identifiers are kept whole (so an exact property
+    or tag name matches strongly) and also split on camelCase / snake_case,
+    so "on row click" still finds OnRowClick.
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        lowered = word.lower()
+        tokens.append(lowered)
+        parts = [p.lower() for piece in word.split("_") for p in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    Persistent BM25 inverted index over a collection's chunks.
+
+    Postings (term -> {chunk id: term frequency}), document lengths and the
+    chunk text/metadata live in memory and are saved as one JSON file under
+    chroma_db_data/bm25. add() / remove() update postings and corpus
+    statistics in place, so an incremental ingest only tokenizes the chunks
+    it writes. Thread-safe: DocLoader writes while the API searches.
+
+    Postings are partitioned by the chunks' "section" metadata; a search
+    scoped to a section only walks that partition's postings (IDF stays
+    corpus-wide, so scores don't depend on the scope).
+    """
+
+    def __init__(self, collection_name: str, base_dir: str = DEFAULT_BM25_DIR, k1: float = 1.5, b: float = 0.75):
+        self.collection_name = collection_name
+        self.path = os.path.join(base_dir, f"{collection_name}.json")
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # section -> term -> {chunk id: term frequency}
+        self.postings = {}
+        self.sections = {}
+        self.doc_lengths = {}
+        # chunk id -> {term: count}, so a chunk's postings can be removed without a scan
+        self.term_counts = {}
+        self.documents = {}
+        self.metadatas = {}
+        self.total_length = 0
+        self.load()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    # -- persistence -------------------------------------------------------------------
+
+    def load(self):
+        self.clear()
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable BM25 index {self.path}: {e}")
+            return
+
+        with self._lock:
+            for chunk_id, (document, metadata, term_counts) in data.get("chunks", {}).items():
+                self._add_one(chunk_id, document, metadata, term_counts)
+
+    def save(self):
+        with self._lock:
+            chunks = {
+                chunk_id: [self.documents[chunk_id], self.metadatas[chunk_id], term_counts]
+                for chunk_id, term_counts in self.term_counts.items()
+            }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "saved_at": time.time(), "chunks": chunks}, f)
+        # Atomic replace so a crash never leaves a half-written index
+        os.replace(tmp_path, self.path)
+
+    # -- updates -----------------------------------------------------------------------
+
+    def clear(self):
+        with self._lock:
+            self.postings = {}
+            self.sections = {}
+            self.doc_lengths = {}
+            self.term_counts = {}
+            self.documents = {}
+            self.metadatas = {}
+            self.total_length = 0
+
+    def _add_one(self, chunk_id, document, metadata, term_counts):
+        section = (metadata or {}).get("section", "")
+        partition = self.postings.setdefault(section, {})
+        for term, count in term_counts.items():
+            partition.setdefault(term, {})[chunk_id] = count
+        self.sections[chunk_id] = section
+        self.term_counts[chunk_id] = dict(term_counts)
+        length = sum(term_counts.values())
+        self.doc_lengths[chunk_id] = length
+        self.total_length += length
+        self.documents[chunk_id] = document
+        self.metadatas[chunk_id] = metadata or {}
+
+    def add(self, ids, texts, metadatas=None):
+        """Insert or replace chunks (same semantics as a Chroma upsert)"""
+        metadatas = metadatas or [{}] * len(ids)
+        # Tokenize outside the lock; searches keep running meanwhile
+        counted = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            self.remove(ids)
+            for chunk_id, text, metadata, term_counts in zip(ids, texts, metadatas, counted):
+                self._add_one(chunk_id, text, metadata, term_counts)
+
+    def remove(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id not in self.doc_lengths:
+                    continue
+                section = self.sections.pop(chunk_id)
+                partition = self.postings[section]
+                for term in self.term_counts.pop(chunk_id):
+                    postings = partition.get(term)
+                    if postings is not None:
+                        postings.pop(chunk_id, None)
+                        if not postings:
+                            del partition[term]
+                if not partition:
+                    del self.postings[section]
+                self.total_length -= self.doc_lengths.pop(chunk_id)
+                del self.documents[chunk_id]
+                del self.metadatas[chunk_id]
+
+    def sync(self, collection, page_size: int = 5000):
+        """Rebuild from a Chroma collection (for stores indexed before BM25 existed)"""
+        start = time.perf_counter()
+        self.clear()
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            self.add(page["ids"], page["documents"], page["metadatas"])
+            offset += len(page["ids"])
+        self.save()
+        print(f"BM25 index '{self.collection_name}': {len(self)} chunks in {time.perf_counter() - start:.2f}s")
+
+    # -- search ------------------------------------------------------------------------
+
+    def search(self, query: str, top_k: int = 5, where: dict = None):
+        """
+        Top-k chunks by BM25 score, best first, as dicts of id / document /
+        metadata / filename / score. `where` is a Chroma metadata filter;
+        an operator it can't evaluate raises ValueError.
+        """
+        terms = set(tokenize(query))
+        sections = scoped_sections(where)
+        with self._lock:
+            n = len(self.doc_lengths)
+            if n == 0 or not terms:
+                return []
+            average_length = self.total_length / n
+            partitions = list(self.postings.values()) if sections is None else [
+                self.postings[s] for s in sections if s in self.postings
+            ]
+
+            scores = Counter()
+            for term in terms:
+                df = sum(len(p.get(term, ())) for p in self.postings.values())
+                if not df:
+                    continue
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for partition in partitions:
+                    for chunk_id, tf in partition.get(term, {}).items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / average_length)
+                        scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            if where and not (sections is not None and set(where) == {"section"}):
+                scores = {
+                    chunk_id: score for chunk_id, score in scores.items()
+                    if matches_where(self.metadatas[chunk_id], where)
+                }
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [
+                {
+                    "id": chunk_id,
+                    "document": self.documents[chunk_id],
+                    "metadata": self.metadatas[chunk_id],
+                    "filename": self.metadatas[chunk_id].get("filename", "Unknown"),
+                    "score": score
+                }
+                for chunk_id, score in best
+            ]
+
+
+def reciprocal_rank_fusion(rankings, top_k: int = None, k: int = 60):
+    """
+    Merge ranked hit lists (dicts with an "id") by reciprocal rank fusion:
+    score = sum over lists of 1 / (k + rank). Only ranks matter, so BM25 and
+    vector scores never need to be put on a common scale.
+    """
+    fused = {}
+    hits = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            fused[hit["id"]] = fused.get(hit["id"], 0.0) + 1.0 / (k + rank)
+            hits.setdefault(hit["id"], hit)
+
+    order = sorted(fused, key=fused.get, reverse=True)
+    if top_k is not None:
+        order = order[:top_k]
+    return [dict(hits[chunk_id], rrf_score=fused[chunk_id]) for chunk_id in order]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index(collection):
+    """
+    Process-wide BM25 index for a collection. Rebuilt from the collection
+    when the saved index is missing or doesn't match the row count.
+    """
+    with _indexes_lock:
+        index = _indexes.get(collection.name)
+        if index is None:
+            index = BM25Index(collection.name)
+            if len(index) != collection.count():
+                index.sync(collection)
+            _indexes[collection.name] = index
+        return index
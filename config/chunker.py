@@ -0,0 +1,110 @@
+import re
+from typing import Callable, List, Optional
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+
+class MarkdownChunker:
+    """
+    Heading-aware markdown chunker.
+
+    Splits a document into sections at markdown headings, then cuts each
+    section into windows of at most max_tokens with overlap_tokens carried
+    over between neighbouring windows. Each chunk is prefixed with its
+    heading path so the embedding keeps the section's context.
+
+    Token counts come from the embedder's tokenizer when one is given
+    (all-MiniLM-L6-v2 truncates at 256 word pieces); otherwise every
+    whitespace-separated word counts as one token.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 256,
+        overlap_tokens: int = 32,
+        tokenizer: Optional[Callable[[str], List[str]]] = None
+    ):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer = tokenizer
+
+    def _token_count(self, word: str) -> int:
+        if self.tokenizer is None:
+            return 1
+        return max(1, len(self.tokenizer(word)))
+
+    def _sections(self, text: str):
+        """Yield (heading_path, body) pairs; fenced code blocks never start a section"""
+        headings = []  # stack of (level, title)
+        body = []
+        in_fence = False
+
+        for line in text.splitlines():
+            if FENCE_RE.match(line):
+                in_fence = not in_fence
+
+            match = None if in_fence else HEADING_RE.match(line)
+            if match:
+                if "".join(body).strip():
+                    yield [title for _, title in headings], "\n".join(body).strip()
+                body = []
+
+                level = len(match.group(1))
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, match.group(2)))
+            else:
+                body.append(line)
+
+        if "".join(body).strip():
+            yield [title for _, title in headings], "\n".join(body).strip()
+
+    def _windows(self, body: str, budget: int):
+        """Cut a section body into overlapping windows of at most `budget` tokens"""
+        # Keep the trailing whitespace with each word so newlines survive the join
+        words = re.findall(r"\S+\s*", body)
+        costs = [self._token_count(w) for w in words]
+
+        start = 0
+        while start < len(words):
+            end = start
+            used = 0
+            while end < len(words) and (used + costs[end] <= budget or end == start):
+                used += costs[end]
+                end += 1
+
+            yield "".join(words[start:end]).strip()
+
+            if end >= len(words):
+                break
+
+            # Step back far enough to repeat roughly overlap_tokens tokens
+            back = end
+            carried = 0
+            while back > start + 1 and carried + costs[back - 1] <= self.overlap_tokens:
+                back -= 1
+                carried += costs[back]
+            start = back
+
+    def chunk(self, text: str) -> List[dict]:
+        """Return a list of {"text", "heading", "heading_path"} dicts in document order"""
+        chunks = []
+
+        for heading_path, body in self._sections(text):
+            heading_line = " > ".join(heading_path)
+            prefix = f"{heading_line}\n\n" if heading_line else ""
+            # The heading prefix is part of the embedded text, so it spends budget too
+            prefix_cost = sum(self._token_count(w) for w in prefix.split())
+            budget = max(self.max_tokens - prefix_cost, self.overlap_tokens + 1)
+
+            for window in self._windows(body, budget):
+                chunks.append({
+                    "text": prefix + window,
+                    "heading": heading_path[-1] if heading_path else "",
+                    "heading_path": heading_line
+                })
+
+        return chunks
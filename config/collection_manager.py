@@ -1,11 +1,34 @@
+from .aliases import resolve_collection
 from .db_client import get_chroma_client
 
 class CollectionManager:
-    def __init__(self, name="table_rf_docs"):
+    def __init__(self, name="table_rf_docs", use_vector_index=False):
         self.client = get_chroma_client()
+        # name may be an alias (see config/aliases.py); work on the collection it points at
+        self.alias = name
+        self.name = resolve_collection(name)
         # Create or get collection
-        self.collection = self.client.get_or_create_collection(name=name)
-        print(f"Collection '{name}' initialized with {self.collection.count()} documents")
+        self.collection = self.client.get_or_create_collection(name=self.name)
+        print(f"Collection '{self.name}' initialized with {self.collection.count()} documents")
+
+        # Optional exact in-process index (config/vector_index.py) that answers
+        # queries without a round-trip through the Chroma client
+        self.vector_index = None
+        if use_vector_index:
+            from .vector_index import get_vector_index
+            self.vector_index = get_vector_index(self.collection)
+
+    def list_collection_names(self):
+        """Names of every collection in the store"""
+        # Older clients return Collection objects, newer ones plain names
+        return [getattr(c, "name", c) for c in self.client.list_collections()]
+
+    def delete_collection(self, name: str):
+        """Drop a whole collection (never the one this manager is bound to)"""
+        if name == self.name:
+            raise ValueError(f"Refusing to delete the active collection '{name}'")
+        self.client.delete_collection(name=name)
+        print(f"Deleted collection '{name}'")
 
     def add_doc(self, doc_id: str, text: str, metadata: dict, embedding):
         """Add a single document to the collection"""
@@ -21,8 +44,76 @@ class CollectionManager:
             print(f"Error adding document {doc_id}: {e}")
             raise
 
+    def add_docs(self, doc_ids: list, texts: list, metadatas: list, embeddings: list):
+        """Add a batch of documents to the collection in as few round-trips as possible"""
+        if not doc_ids:
+            return 0
+
+        # Chroma rejects inserts above the client's max batch size
+        try:
+            max_batch = self.client.get_max_batch_size()
+        except Exception:
+            max_batch = len(doc_ids)
+
+        for start in range(0, len(doc_ids), max_batch):
+            end = start + max_batch
+            try:
+                self.collection.add(
+                    ids=doc_ids[start:end],
+                    documents=texts[start:end],
+                    metadatas=metadatas[start:end],
+                    embeddings=embeddings[start:end]
+                )
+            except Exception as e:
+                print(f"Error adding batch of {len(doc_ids[start:end])} documents: {e}")
+                raise
+
+        print(f"Added {len(doc_ids)} docs")
+        return len(doc_ids)
+
+    def upsert_docs(self, doc_ids: list, texts: list, metadatas: list, embeddings: list):
+        """Insert or replace a batch of documents keyed by their (stable) ids"""
+        if not doc_ids:
+            return 0
+
+        try:
+            max_batch = self.client.get_max_batch_size()
+        except Exception:
+            max_batch = len(doc_ids)
+
+        for start in range(0, len(doc_ids), max_batch):
+            end = start + max_batch
+            try:
+                self.collection.upsert(
+                    ids=doc_ids[start:end],
+                    documents=texts[start:end],
+                    metadatas=metadatas[start:end],
+                    embeddings=embeddings[start:end]
+                )
+            except Exception as e:
+                print(f"Error upserting batch of {len(doc_ids[start:end])} documents: {e}")
+                raise
+
+        print(f"Upserted {len(doc_ids)} docs")
+        return len(doc_ids)
+
+    def get_ids(self):
+        """Return the ids of every document in the collection"""
+        return self.collection.get(include=[])["ids"]
+
+    def delete_docs(self, doc_ids: list):
+        """Delete documents by id"""
+        if not doc_ids:
+            return 0
+        self.collection.delete(ids=doc_ids)
+        print(f"Deleted {len(doc_ids)} docs")
+        return len(doc_ids)
+
     def query_docs(self, query_embedding, top_k=5):
         """Query top_k similar documents"""
+        if self.vector_index is not None:
+            return self.vector_index.query(query_embedding, top_k)
+
         result = self.collection.query(
             query_embeddings=[query_embedding],
             n_results=top_k,
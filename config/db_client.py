@@ -1,9 +1,11 @@
-import chromadb
+# Location of the persistent Chroma store and any sidecar files kept next to it
+CHROMA_DB_PATH = "./chroma_db_data"
+
 
 def get_chroma_client():
     """
-    Returns a persistent ChromaDB client
+    Returns the process-wide persistent ChromaDB client
     """
-    # NEW API - Use PersistentClient
-    client = chromadb.PersistentClient(path="./chroma_db_data")
-    return client
\ No newline at end of file
+    # Opened once and shared (see config/registry.py)
+    from .registry import get_chroma_client as shared_client
+    return shared_client(CHROMA_DB_PATH)
@@ -1,30 +1,178 @@
 import os
+import queue
+import threading
+import time
 import uuid
-from sentence_transformers import SentenceTransformer
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .aliases import set_alias
 from .collection_manager import CollectionManager
+from .manifest import DocManifest, content_hash
+from .chunker import MarkdownChunker
+from .embedding_cache import get_embedding_cache
+from .embedding_backend import cache_namespace, resolve_backend
+from .registry import get_embedder, get_tokenizer
+from .ulid import new_ulid, ulid_time
+from .vector_index import DEFAULT_INDEX_DIR, refresh_vector_index
+from .bm25_index import DEFAULT_BM25_DIR, get_bm25_index
+
+# Bump when chunk metadata gains fields: the manifest then no longer matches and
+# the next sync rewrites every row with the new metadata
+# (3: paths, ids and sections are relative to DOCS_ROOT, not the loaded folder)
+METADATA_VERSION = 3
+
+# Top-level docs folder; sections are the product-area folders directly below it
+DOCS_ROOT = "./docs"
+
+# First keyword found in a file name -> doc_type
+DOC_TYPES = (
+    ("faq", "faq"),
+    ("reference", "reference"),
+    ("events", "reference"),
+    ("example", "example"),
+    ("sample", "example"),
+    ("quick_start", "guide"),
+    ("best_practice", "guide"),
+    ("configur", "guide"),
+    ("creation", "guide"),
+    ("overview", "overview"),
+    ("intro", "overview"),
+    ("key_", "overview"),
+)
+
+
+def section_for_path(relative_path: str) -> str:
+    """
+    Top-level folder of a path relative to DOCS_ROOT (the product area),
+    "general" for files at the root
+    """
+    parts = relative_path.replace(os.sep, "/").split("/")
+    return parts[0] if len(parts) > 1 else "general"
+
+
+def doc_type_for_path(relative_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(relative_path))[0].lower()
+    for keyword, doc_type in DOC_TYPES:
+        if keyword in stem:
+            return doc_type
+    return "concept"
+
+
+def doc_id_for_path(relative_path: str) -> str:
+    """Stable document id derived from the doc's path, so re-syncs upsert in place"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, relative_path.replace(os.sep, "/")))
+
+
+def chunk_id(doc_id: str, chunk_index: int) -> str:
+    return f"{doc_id}:{chunk_index}"
+
+
+def _bounded_map(pool, fn, items, window):
+    """Ordered pool.map that keeps at most `window` tasks in flight"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
 
 class DocLoader:
-    def __init__(self, docs_dir="./docs"):
-        self.docs_dir = docs_dir
-        self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
-        self.collection = CollectionManager("table_rf_docs")
-        
-        print(f"Looking for docs in: {os.path.abspath(self.docs_dir)}")
+    def __init__(
+        self,
+        docs_dir="./docs",
+        batch_size=64,
+        collection_name="table_rf_docs",
+        chunk_tokens=200,
+        chunk_overlap=32,
+        pipelined=False,
+        read_workers=8,
+        encode_processes=0,
+        queue_size=4,
+        use_embedding_cache=True,
+        embedding_backend=None,
+        use_bm25=True,
+        docs_root=DOCS_ROOT
+    ):
+        """
+        docs_dir may be docs_root or any folder below it (e.g. ./docs/tablerf
+        to sync one product area). Paths, chunk ids and sections are always
+        relative to docs_root, so a file keeps its id and section whichever
+        folder is loaded, and a partial load only removes rows for files
+        under docs_dir. A docs_dir outside docs_root is its own root.
 
-    def load_docs(self):
-        """Recursively load all .md files under docs directory"""
+        pipelined=True overlaps the three ingest stages: a thread pool of
+        read_workers reads, hashes and chunks files; the encoder embeds
+        batches (across encode_processes worker processes when > 1); and a
+        single writer thread does the Chroma bulk upserts. queue_size bounds
+        how many embedded batches may wait for the writer.
 
-        if not os.path.exists(self.docs_dir):
-            print(f"Directory not found: {self.docs_dir}")
-            return 0
-        
-        initial_count = self.collection.get_count()
-        print(f"Initial document count: {initial_count}")
+        With use_embedding_cache=True chunks whose text was embedded before
+        (in any collection, or before the store was wiped) reuse the cached
+        vector instead of going through the model.
+
+        embedding_backend picks torch / onnx / onnx-int8 (see
+        config/embedding_backend.py); None uses EMBEDDING_BACKEND.
+
+        With use_bm25=True every write and delete is mirrored into the
+        collection's BM25 keyword index (config/bm25_index.py), which the
+        agent fuses with vector results.
+        """
+        self.docs_dir = docs_dir
+        root, loaded = os.path.abspath(docs_root), os.path.abspath(docs_dir)
+        if os.path.commonpath([root, loaded]) != root:
+            root = loaded
+        self.docs_root = root
+        # Manifest path prefix of the files this loader can see ("" for the whole root)
+        scope = os.path.relpath(loaded, root)
+        self._scope = "" if scope == "." else scope + os.sep
+        self.batch_size = batch_size
+        self.pipelined = pipelined
+        self.read_workers = read_workers
+        self.encode_processes = encode_processes
+        self.queue_size = queue_size
+        # Shared with every other user of the model in this process
+        self.embedder = get_embedder("all-MiniLM-L6-v2", embedding_backend)
+        self.collection = CollectionManager(collection_name)
+        self.embedding_cache = get_embedding_cache(
+            cache_namespace("all-MiniLM-L6-v2", embedding_backend),
+            self.embedder.get_sentence_embedding_dimension()
+        ) if use_embedding_cache else None
+        # Shared with the agent in this process; built from the rows on first use
+        self.bm25 = get_bm25_index(self.collection.collection) if use_bm25 else None
+        # Chunking runs on the reader threads while the shared model encodes here and
+        # on request threads, so token counts come from a per-thread tokenizer
+        self.embedding_backend = embedding_backend
+        self.chunker = MarkdownChunker(
+            max_tokens=chunk_tokens,
+            overlap_tokens=chunk_overlap,
+            tokenizer=self._tokenize
+        )
+        # Keyed by the physical collection, which an alias swap may change
+        self.manifest = DocManifest(
+            self.collection.name,
+            settings={
+                "chunk_tokens": chunk_tokens,
+                "chunk_overlap": chunk_overlap,
+                "metadata_version": METADATA_VERSION,
+                # Vectors from different backends differ slightly; don't mix them in one collection
+                "embedding_backend": resolve_backend(embedding_backend)
+            }
+        )
+        # Main thread (touched files) and writer thread (written files) both update it
+        self._manifest_lock = threading.Lock()
+        self._encode_pool = None
+        # Outcome of the most recent load_docs() call
+        self.last_stats = {}
 
-        files_added = 0
-        self.collection.clear_collection()
+        print(f"Looking for docs in: {os.path.abspath(self.docs_dir)}")
+
+    def _tokenize(self, text):
+        return get_tokenizer("all-MiniLM-L6-v2", self.embedding_backend).tokenize(text)
 
+    def _iter_files(self):
+        """Yield (file_path, relative_path, filename) for every .md file"""
         # Walk all folders under docs/
         for root, _, files in os.walk(self.docs_dir):
 
@@ -35,48 +183,436 @@ class DocLoader:
                 file_path = os.path.join(root, filename)
 
                 # generate metadata friendly relative folder
-                relative_path = os.path.relpath(file_path, self.docs_dir)
+                relative_path = os.path.relpath(file_path, self.docs_root)
 
-                print(f"\nProcessing: {relative_path}")
+                yield file_path, relative_path, filename
 
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        text = f.read().strip()
-                    
-                    if not text:
-                        print(f"Skipping empty file: {filename}")
-                        continue
-
-                    # Generate embedding
-                    embedding = self.embedder.encode(text).tolist()
-
-                    # Add to vector store
-                    self.collection.add_doc(
-                        doc_id=str(uuid.uuid4()),
-                        text=text,
-                        metadata={
-                            "filename": filename,
-                            "path": relative_path
-                        },
-                        embedding=embedding
+    def _read_doc(self, file_path, relative_path, filename):
+        """Read a file and build its doc record, or None if it is empty/unreadable"""
+        try:
+            stat = os.stat(file_path)
+            with open(file_path, "r", encoding="utf-8") as f:
+                text = f.read().strip()
+        except Exception as e:
+            print(f"Error reading {relative_path}: {e}")
+            return None
+
+        if not text:
+            print(f"Skipping empty file: {filename}")
+            return None
+
+        return {
+            "relative_path": relative_path,
+            "filename": filename,
+            "text": text,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": content_hash(text)
+        }
+
+    def _chunk_doc(self, doc):
+        """Split a doc into chunk rows, stored on the doc as (ids, texts, metadatas)"""
+        doc_id = doc_id_for_path(doc["relative_path"])
+        chunks = self.chunker.chunk(doc["text"])
+        section = section_for_path(doc["relative_path"])
+        doc_type = doc_type_for_path(doc["relative_path"])
+
+        ids, texts, metadatas = [], [], []
+        for i, chunk in enumerate(chunks):
+            ids.append(chunk_id(doc_id, i))
+            texts.append(chunk["text"])
+            metadatas.append({
+                "filename": doc["filename"],
+                "path": doc["relative_path"],
+                # Scope queries with filter_metadata={"section": "tablerf"}, doc_type, ...
+                "section": section,
+                "doc_type": doc_type,
+                "heading": chunk["heading"],
+                "heading_path": chunk["heading_path"],
+                "chunk_index": i,
+                "chunk_count": len(chunks),
+                "chunk_chars": len(chunk["text"]),
+                "doc_size": doc["size"],
+                "content_hash": doc["hash"]
+            })
+
+        doc["chunk_ids"] = ids
+        doc["chunk_texts"] = texts
+        doc["chunk_metadatas"] = metadatas
+
+    def _inspect_file(self, file_info):
+        """
+        Stat, read, hash and chunk one file against the manifest.
+
+        Returns (relative_path, status, doc). Only reads shared state, so it is
+        safe to run on reader threads; the caller applies the result.
+        """
+        file_path, relative_path, filename = file_info
+
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            print(f"Error reading {relative_path}: {e}")
+            return relative_path, "error", None
+
+        if self.manifest.is_unchanged(relative_path, stat.st_mtime, stat.st_size):
+            return relative_path, "unchanged", None
+
+        doc = self._read_doc(file_path, relative_path, filename)
+        if doc is None:
+            return relative_path, "empty", None
+
+        entry = self.manifest.get(relative_path)
+        if entry and entry["hash"] == doc["hash"]:
+            return relative_path, "touched", doc
+
+        if entry:
+            doc["previous_ids"] = entry["ids"]
+        self._chunk_doc(doc)
+        return relative_path, "updated" if entry else "added", doc
+
+    def _changed_docs(self, stats, reader_pool=None):
+        """Yield docs that are new or whose content changed since the last sync"""
+        if reader_pool is None:
+            inspections = map(self._inspect_file, self._iter_files())
+        else:
+            inspections = _bounded_map(
+                reader_pool, self._inspect_file, self._iter_files(),
+                window=self.read_workers * self.batch_size
+            )
+
+        for relative_path, status, doc in inspections:
+            stats["seen"].add(relative_path)
+
+            if status == "empty":
+                # Treat empty/unreadable files as gone so their old rows are removed
+                stats["seen"].discard(relative_path)
+            elif status == "unchanged":
+                stats["unchanged"] += 1
+            elif status == "touched":
+                # Touched but not edited: remember the new mtime, skip the embedding
+                with self._manifest_lock:
+                    entry = self.manifest.get(relative_path)
+                    self.manifest.update(
+                        relative_path, doc["mtime"], doc["size"], doc["hash"], entry["ids"]
                     )
+                stats["unchanged"] += 1
+            elif status in ("added", "updated"):
+                stats[status] += 1
+                yield doc
+
+    def _iter_batches(self, docs):
+        """Group documents into lists of at most batch_size"""
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _encode_uncached(self, texts):
+        if self._encode_pool is not None:
+            return self.embedder.encode_multi_process(
+                texts, self._encode_pool, batch_size=self.batch_size
+            )
+        return self.embedder.encode(texts, batch_size=self.batch_size)
+
+    def _encode(self, texts):
+        """Embed all chunk texts of a batch in one encode call (cache misses only)"""
+        if self.embedding_cache is not None:
+            return self.embedding_cache.encode(texts, self._encode_uncached).tolist()
+        return self._encode_uncached(texts).tolist()
+
+    def _write_batch(self, batch, embeddings):
+        """Upsert an embedded batch with one write call and record it in the manifest"""
+        ids = [cid for doc in batch for cid in doc["chunk_ids"]]
+        texts = [text for doc in batch for text in doc["chunk_texts"]]
+        metadatas = [meta for doc in batch for meta in doc["chunk_metadatas"]]
+
+        # Add to vector store
+        self.collection.upsert_docs(
+            doc_ids=ids,
+            texts=texts,
+            metadatas=metadatas,
+            embeddings=embeddings
+        )
+        if self.bm25 is not None:
+            self.bm25.add(ids, texts, metadatas)
 
-                    files_added += 1
+        for doc in batch:
+            # A shorter edit leaves fewer chunks: drop the tail the upsert didn't overwrite
+            stale_ids = set(doc.get("previous_ids", [])) - set(doc["chunk_ids"])
+            if stale_ids:
+                self._delete_rows(list(stale_ids))
 
+            with self._manifest_lock:
+                self.manifest.update(
+                    doc["relative_path"], doc["mtime"], doc["size"], doc["hash"], doc["chunk_ids"]
+                )
+
+        return len(batch)
+
+    def _safe_write(self, batch, embeddings):
+        try:
+            return self._write_batch(batch, embeddings)
+        except Exception as e:
+            print(f"Error writing batch starting at {batch[0]['relative_path']}: {e}")
+            return 0
+
+    def _writer_loop(self, write_queue, written):
+        """Single writer: drains embedded batches into Chroma until it sees None"""
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            written[0] += self._safe_write(*item)
+
+    def _ingest(self, stats):
+        """Run read -> encode -> write over every changed file; returns files written"""
+        reader_pool = None
+        writer = None
+        write_queue = None
+        written = [0]
+
+        if self.pipelined:
+            reader_pool = ThreadPoolExecutor(
+                max_workers=self.read_workers, thread_name_prefix="doc-reader"
+            )
+            write_queue = queue.Queue(maxsize=self.queue_size)
+            writer = threading.Thread(
+                target=self._writer_loop, args=(write_queue, written),
+                name="doc-writer", daemon=True
+            )
+            writer.start()
+            if self.encode_processes > 1:
+                self._encode_pool = self.embedder.start_multi_process_pool(
+                    target_devices=["cpu"] * self.encode_processes
+                )
+
+        try:
+            for batch in self._iter_batches(self._changed_docs(stats, reader_pool)):
+                print(f"\nProcessing batch of {len(batch)} files "
+                      f"({batch[0]['relative_path']} ... {batch[-1]['relative_path']})")
+
+                try:
+                    embeddings = self._encode(
+                        [text for doc in batch for text in doc["chunk_texts"]]
+                    )
                 except Exception as e:
-                    print(f"Error processing {relative_path}: {e}")
+                    print(f"Error embedding batch starting at {batch[0]['relative_path']}: {e}")
                     continue
 
+                if write_queue is None:
+                    written[0] += self._safe_write(batch, embeddings)
+                else:
+                    # Blocks when the writer falls behind, bounding memory use
+                    write_queue.put((batch, embeddings))
+        finally:
+            if writer is not None:
+                write_queue.put(None)
+                writer.join()
+            if reader_pool is not None:
+                reader_pool.shutdown(wait=True)
+            if self._encode_pool is not None:
+                self.embedder.stop_multi_process_pool(self._encode_pool)
+                self._encode_pool = None
+
+        return written[0]
+
+    def _delete_rows(self, ids):
+        """Delete chunk rows from the collection and the BM25 index"""
+        if self.bm25 is not None:
+            self.bm25.remove(ids)
+        return self.collection.delete_docs(ids)
+
+    def _remove_deleted(self, seen_paths):
+        """Delete rows for files that disappeared (or became empty) since the last sync"""
+        removed = 0
+        for relative_path in self.manifest.paths() - seen_paths:
+            if not relative_path.startswith(self._scope):
+                continue  # outside the folder being loaded
+            entry = self.manifest.remove(relative_path)
+            self._delete_rows(entry["ids"])
+            removed += 1
+        return removed
+
+    def load_docs(self, incremental=True):
+        """
+        Recursively load all .md files under docs directory.
+
+        With incremental=True (default) only new or changed files are embedded
+        and rows for removed files are deleted; the collection stays queryable
+        throughout. incremental=False clears the collection and rebuilds it.
+        """
+
+        if not os.path.exists(self.docs_dir):
+            print(f"Directory not found: {self.docs_dir}")
+            return 0
+
+        initial_count = self.collection.get_count()
+        print(f"Initial document count: {initial_count}")
+
+        if not incremental:
+            self.collection.clear_collection()
+            self.manifest.reset()
+            if self.bm25 is not None:
+                self.bm25.clear()
+        elif initial_count == 0:
+            # The store was wiped or migrated: the manifest no longer describes it
+            self.manifest.reset()
+
+        # Rows written before the manifest existed (random ids) are replaced once
+        legacy_ids = set()
+        if initial_count > 0 and not self.manifest.paths():
+            legacy_ids = set(self.collection.get_ids())
+
+        stats = {"seen": set(), "added": 0, "updated": 0, "unchanged": 0}
+
+        start_time = time.perf_counter()
+
+        files_written = self._ingest(stats)
+
+        files_removed = self._remove_deleted(stats["seen"])
+        legacy_removed = 0
+        if legacy_ids:
+            current_ids = {i for p in self.manifest.paths() for i in self.manifest.get(p)["ids"]}
+            legacy_removed = self._delete_rows(list(legacy_ids - current_ids))
+        self.manifest.save()
+        if self.bm25 is not None:
+            self.bm25.save()
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+
+        elapsed = time.perf_counter() - start_time
+        docs_per_sec = files_written / elapsed if elapsed > 0 else 0.0
+
         final_count = self.collection.get_count()
 
+        if self.collection_changed:
+            # Keep an exported in-process vector index (if any) in step with the rows
+            refresh_vector_index(self.collection.collection)
+
+        self.last_stats = {
+            "added": stats["added"],
+            "updated": stats["updated"],
+            "unchanged": stats["unchanged"],
+            "removed": files_removed,
+            "legacy_removed": legacy_removed,
+            "written": files_written,
+            "elapsed_seconds": elapsed,
+            "docs_per_sec": docs_per_sec
+        }
+
         print(f"\n{'='*50}")
-        print(f"Successfully added {files_added} documents")
+        print(f"Successfully wrote {files_written} documents")
+        print(f"Added: {stats['added']}, updated: {stats['updated']}, "
+              f"unchanged: {stats['unchanged']}, removed: {files_removed}")
         print(f"Initial count: {initial_count}")
         print(f"Final count: {final_count}")
-        print(f"Expected count: {initial_count + files_added}")
+        print(f"Elapsed: {elapsed:.2f}s ({docs_per_sec:.1f} docs/sec)")
+        if self.embedding_cache is not None:
+            cache_stats = self.embedding_cache.stats()
+            print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
         print(f"{'='*50}\n")
 
-        return files_added
+        return files_written
+
+    @property
+    def collection_changed(self) -> bool:
+        """True if the last load_docs() call wrote or removed any rows"""
+        return bool(
+            self.last_stats.get("written") or self.last_stats.get("removed")
+            or self.last_stats.get("legacy_removed")
+        )
+
+
+# Shadow collections are named <alias>__<ULID>: unique even for rebuilds started in
+# the same second, and the ULID encodes the creation time. Older shadows used this
+# one-second timestamp suffix and are still recognized.
+SHADOW_SUFFIX_FORMAT = "%Y%m%d%H%M%S"
+
+
+def _shadow_created_at(suffix):
+    try:
+        return ulid_time(suffix)
+    except ValueError:
+        return time.mktime(time.strptime(suffix, SHADOW_SUFFIX_FORMAT))
+
+
+def _retired_at(alias, names):
+    """
+    name -> when the alias moved off it, for every collection in the alias's
+    family: a collection is retired when its successor was created, and a
+    shadow's creation time is its name suffix. Unparseable names are left out.
+    """
+    created = {}
+    for name in names:
+        if name.startswith(f"{alias}__"):
+            try:
+                created[name] = _shadow_created_at(name[len(alias) + 2:])
+            except ValueError:
+                continue
+    order = ([alias] if alias in names else []) + sorted(created, key=created.get)
+    return {name: created[successor] for name, successor in zip(order, order[1:])}
+
+
+def rebuild_with_swap(
+    alias="table_rf_docs", docs_dir="./docs", keep_previous=True, retire_after_seconds=3600,
+    **loader_kwargs
+):
+    """
+    Build a fresh index in a shadow collection, then atomically point the
+    alias at it.
+
+    Readers keep querying the old collection until the swap and the new one
+    after it; they never see an empty or half-built index. Other processes
+    re-resolve the alias on their next request, so a retired collection is
+    only dropped once it has been out of service for retire_after_seconds
+    (the previous one is always kept with keep_previous=True, so a swap can
+    be rolled back). Unchanged chunks come out of the embedding cache, so a
+    rebuild mostly costs the Chroma writes.
+    """
+    shadow = f"{alias}__{new_ulid()}"
+    loader = DocLoader(docs_dir=docs_dir, collection_name=shadow, **loader_kwargs)
+    written = loader.load_docs(incremental=False)
+
+    if loader.collection.get_count() == 0:
+        loader.collection.client.delete_collection(name=shadow)
+        raise RuntimeError(f"No documents indexed from {docs_dir}; keeping the current index")
+
+    previous = set_alias(alias, shadow)
+    print(f"Alias '{alias}': {previous} -> {shadow}")
+
+    keep = {shadow, previous} if keep_previous else {shadow}
+    retired_at = _retired_at(alias, loader.collection.list_collection_names())
+    removed = []
+    for name, retired in retired_at.items():
+        # A process that hasn't served a request since the swap may still be bound to it
+        if name in keep or time.time() - retired < retire_after_seconds:
+            continue
+        loader.collection.delete_collection(name)
+        manifest_path = DocManifest(name).path
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        for path in (
+            os.path.join(DEFAULT_INDEX_DIR, f"{name}.f32"),
+            os.path.join(DEFAULT_INDEX_DIR, f"{name}.meta.json"),
+            os.path.join(DEFAULT_BM25_DIR, f"{name}.json")
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(name)
+
+    return {
+        "alias": alias,
+        "collection": shadow,
+        "previous_collection": previous,
+        "removed_collections": removed,
+        "documents_loaded": written,
+        "stats": loader.last_stats
+    }
 
 
 # Test script
@@ -86,7 +622,7 @@ if __name__ == "__main__":
 
     if count > 0:
         print("\nTesting query...")
-        embedder = SentenceTransformer("all-MiniLM-L6-v2")
+        embedder = get_embedder("all-MiniLM-L6-v2")
         query_emb = embedder.encode("TableRF component").tolist()
 
         results = loader.collection.query_docs(query_emb, top_k=3)
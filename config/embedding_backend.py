@@ -0,0 +1,93 @@
+import os
+
+from .db_client import CHROMA_DB_PATH
+
+# Default backend for every embedder in the process (EMBEDDING_BACKEND=onnx-int8 ...)
+DEFAULT_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+
+# Quantized ONNX weights shipped in the model repo; pick the one matching the CPU
+# (e.g. onnx/model_qint8_arm64.onnx on ARM, onnx/model_qint8_avx512_vnni.onnx on newer Xeons)
+DEFAULT_INT8_FILE = os.environ.get("EMBEDDING_INT8_FILE", "onnx/model_qint8_avx2.onnx")
+
+EXPORT_DIR = os.path.join(CHROMA_DB_PATH, "onnx_models")
+
+
+def _load_torch(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def _load_onnx(model_name: str):
+    """Float32 ONNX Runtime graph of the same weights; CPU only"""
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name, backend="onnx")
+    except ImportError as e:
+        raise ImportError(
+            "The onnx embedding backends need `pip install sentence-transformers[onnx]`"
+        ) from e
+
+
+def _load_onnx_int8(model_name: str):
+    """
+    Dynamically int8-quantized ONNX graph. Uses the pre-quantized file from
+    the model repo when it exists, otherwise quantizes the float graph once
+    and keeps the result under EXPORT_DIR.
+    """
+    from huggingface_hub.utils import EntryNotFoundError
+    from sentence_transformers import SentenceTransformer
+    try:
+        return SentenceTransformer(
+            model_name, backend="onnx", model_kwargs={"file_name": DEFAULT_INT8_FILE}
+        )
+    except ImportError as e:
+        raise ImportError(
+            "The onnx embedding backends need `pip install sentence-transformers[onnx]`"
+        ) from e
+    except (EntryNotFoundError, FileNotFoundError) as e:
+        # Only a missing file means "quantize it ourselves"; anything else is a real failure
+        print(f"No pre-quantized {DEFAULT_INT8_FILE} for {model_name} ({e}); quantizing locally")
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    export_path = os.path.join(EXPORT_DIR, model_name.replace("/", "_"))
+    quantized_file = "onnx/model_qint8_avx2.onnx"
+    if not os.path.exists(os.path.join(export_path, quantized_file)):
+        model = _load_onnx(model_name)
+        model.save_pretrained(export_path)
+        export_dynamic_quantized_onnx_model(model, "avx2", export_path)
+    return SentenceTransformer(
+        export_path, backend="onnx", model_kwargs={"file_name": quantized_file}
+    )
+
+
+# name -> loader; every loader returns an object with the SentenceTransformer API
+# (encode, tokenizer, get_sentence_embedding_dimension, ...)
+EMBEDDING_BACKENDS = {
+    "torch": _load_torch,
+    "onnx": _load_onnx,
+    "onnx-int8": _load_onnx_int8,
+}
+
+
+def resolve_backend(backend: str = None) -> str:
+    backend = backend or DEFAULT_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend '{backend}'. Choose one of: {', '.join(EMBEDDING_BACKENDS)}"
+        )
+    return backend
+
+
+def load_embedder(model_name: str, backend: str = None):
+    return EMBEDDING_BACKENDS[resolve_backend(backend)](model_name)
+
+
+def cache_namespace(model_name: str, backend: str = None) -> str:
+    """
+    Embedding-cache namespace for a model/backend pair. Backends produce
+    slightly different vectors, so they never share cached entries; torch
+    keeps the bare model name so existing caches stay valid.
+    """
+    backend = resolve_backend(backend)
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from .db_client import CHROMA_DB_PATH
+
+DEFAULT_CACHE_DIR = os.path.join(CHROMA_DB_PATH, "embedding_cache")
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, dim: int, max_entries: int = 100_000,
+                        cache_dir: str = DEFAULT_CACHE_DIR):
+    """Return the process-wide cache for a model so every user shares one index"""
+    key = (model_name, os.path.abspath(cache_dir))
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(model_name, dim, max_entries, cache_dir)
+        return _caches[key]
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model name, sha256 of text).
+
+    Vectors live in a memory-mapped float32 matrix with one row per slot; a
+    parallel matrix holds each slot's sha256 digest so a stale or foreign
+    index entry can never return the wrong vector. The key -> slot map and
+    LRU clock are kept in a JSON index file. When every slot is taken the
+    least recently used tenth of the cache is evicted in one go.
+    """
+
+    def __init__(self, model_name: str, dim: int, max_entries: int = 100_000,
+                 cache_dir: str = DEFAULT_CACHE_DIR, flush_every: int = 1000):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dirty = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.vectors_path = base + ".f32"
+        self.keys_path = base + ".keys"
+        self.index_path = base + ".index.json"
+
+        self._open()
+
+    def _open(self):
+        index = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            except Exception as e:
+                print(f"Ignoring unreadable embedding cache index {self.index_path}: {e}")
+
+        reuse = (
+            index is not None
+            and index.get("dim") == self.dim
+            and index.get("max_entries") == self.max_entries
+            and os.path.exists(self.vectors_path)
+            and os.path.exists(self.keys_path)
+        )
+        mode = "r+" if reuse else "w+"
+
+        self.vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode=mode, shape=(self.max_entries, self.dim)
+        )
+        self.keys = np.memmap(
+            self.keys_path, dtype=np.uint8, mode=mode, shape=(self.max_entries, 32)
+        )
+
+        if reuse:
+            self.slots = {k: tuple(v) for k, v in index["slots"].items()}
+            self.tick = index.get("tick", 0)
+        else:
+            self.slots = {}  # hex digest -> (slot, last_used)
+            self.tick = 0
+        used = {slot for slot, _ in self.slots.values()}
+        self.free = [i for i in range(self.max_entries - 1, -1, -1) if i not in used]
+
+        print(f"Embedding cache '{self.model_name}': {len(self.slots)} cached vectors")
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _evict(self):
+        """Free the least recently used ~10% of slots"""
+        count = max(1, self.max_entries // 10)
+        victims = sorted(self.slots.items(), key=lambda kv: kv[1][1])[:count]
+        for key, (slot, _) in victims:
+            del self.slots[key]
+            self.keys[slot] = 0
+            self.free.append(slot)
+
+    def get_many(self, texts):
+        """Return a list with a cached vector (np.ndarray) or None per text"""
+        results = []
+        with self._lock:
+            for text in texts:
+                digest = self.digest(text)
+                entry = self.slots.get(digest.hex())
+                if entry is None or bytes(self.keys[entry[0]]) != digest:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+
+                self.tick += 1
+                self.slots[digest.hex()] = (entry[0], self.tick)
+                self.hits += 1
+                results.append(np.array(self.vectors[entry[0]]))
+        return results
+
+    def put_many(self, texts, vectors):
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                digest = self.digest(text)
+                key = digest.hex()
+                self.tick += 1
+
+                if key in self.slots:
+                    slot = self.slots[key][0]
+                else:
+                    if not self.free:
+                        self._evict()
+                    slot = self.free.pop()
+
+                self.vectors[slot] = np.asarray(vector, dtype=np.float32)
+                self.keys[slot] = np.frombuffer(digest, dtype=np.uint8)
+                self.slots[key] = (slot, self.tick)
+                self._dirty += 1
+
+            if self._dirty >= self.flush_every:
+                self._flush_locked()
+
+    def encode(self, texts, encode_fn):
+        """
+        Embed texts, calling encode_fn(list_of_texts) only for cache misses.
+        Returns an np.ndarray of shape (len(texts), dim).
+        """
+        cached = self.get_many(texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+
+        if missing:
+            fresh = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            self.put_many([texts[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                cached[i] = vector
+
+        if not cached:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack(cached)
+
+    def _flush_locked(self):
+        self.vectors.flush()
+        self.keys.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model_name": self.model_name,
+                "dim": self.dim,
+                "max_entries": self.max_entries,
+                "tick": self.tick,
+                "slots": self.slots
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = 0
+
+    def flush(self):
+        """Persist vectors and the index to disk"""
+        with self._lock:
+            self._flush_locked()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "entries": len(self.slots),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
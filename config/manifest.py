@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+
+from .db_client import CHROMA_DB_PATH
+
+
+def content_hash(text: str) -> str:
+    """sha256 of a document's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def manifest_signature(collection_name: str, base_dir: str = CHROMA_DB_PATH):
+    """
+    Hash of what a collection's manifest says was indexed (ingest settings,
+    and every file's content hash and chunk ids), or None without a manifest.
+    mtimes are left out, so touching a file doesn't change it.
+    """
+    path = os.path.join(base_dir, f"{collection_name}_manifest.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    files = {
+        relative_path: [entry["hash"], entry["ids"]]
+        for relative_path, entry in data.get("files", {}).items()
+    }
+    payload = json.dumps([data.get("settings", {}), files], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DocManifest:
+    """
+    Record of what has been indexed into a collection: path -> mtime, size, hash.
+
+    Persisted as JSON next to the Chroma store so an incremental sync can tell
+    new, changed, unchanged and removed files apart without re-embedding.
+    """
+
+    def __init__(self, collection_name: str, base_dir: str = CHROMA_DB_PATH, settings: dict = None):
+        self.path = os.path.join(base_dir, f"{collection_name}_manifest.json")
+        # Ingest settings (e.g. chunk sizes) the entries were produced with
+        self.settings = settings or {}
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            self.entries = {}
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable manifest {self.path}: {e}")
+            self.entries = {}
+            return
+
+        if data.get("settings", {}) != self.settings:
+            # Rows were built differently (e.g. other chunk sizes): everything is stale
+            print(f"Manifest {self.path} was built with other settings, re-indexing all files")
+            self.entries = {}
+            return
+        self.entries = data.get("files", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "files": self.entries}, f, indent=2, sort_keys=True)
+        # Atomic replace so a crash never leaves a half-written manifest
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.entries = {}
+
+    def get(self, relative_path: str):
+        return self.entries.get(relative_path)
+
+    def is_unchanged(self, relative_path: str, mtime: float, size: int) -> bool:
+        """Cheap stat-only check, used before reading the file at all"""
+        entry = self.entries.get(relative_path)
+        return bool(entry) and entry["mtime"] == mtime and entry["size"] == size
+
+    def update(self, relative_path: str, mtime: float, size: int, digest: str, doc_ids: list):
+        self.entries[relative_path] = {
+            "mtime": mtime,
+            "size": size,
+            "hash": digest,
+            "ids": doc_ids
+        }
+
+    def remove(self, relative_path: str):
+        return self.entries.pop(relative_path, None)
+
+    def paths(self):
+        return set(self.entries.keys())
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .db_client import CHROMA_DB_PATH
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+_instances = {}
+_locks = {}
+_registry_lock = threading.Lock()
+# Per-thread tokenizers, see get_tokenizer()
+_thread_tokenizers = threading.local()
+
+# name -> {"seconds", "rss_before_mb", "rss_after_mb"} for everything loaded so far
+_timings = {}
+_process_start = time.perf_counter()
+
+
+def _rss_mb():
+    """
+    Current resident set size of this process in MB, or None where it can't
+    be measured (e.g. Windows without psutil)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+
+    try:
+        # Unix without /proc: fall back to the peak RSS (kB on Linux, bytes on macOS)
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if peak > 1 << 32 else peak / 1024
+
+
+def record_timing(name: str, seconds: float, rss_before_mb: float = None):
+    _timings[name] = {
+        "seconds": seconds,
+        "rss_before_mb": rss_before_mb,
+        "rss_after_mb": _rss_mb()
+    }
+
+
+@contextmanager
+def timed(name: str):
+    """Add a startup phase to the timing report"""
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start, rss_before)
+
+
+def format_timing(timing: dict) -> str:
+    """One startup_report() timing as "1.23s, RSS 456 MB" (RSS may be unknown)"""
+    rss = timing["rss_after_mb"]
+    return f"{timing['seconds']:.2f}s, RSS " + (f"{rss:.0f} MB" if rss is not None else "n/a")
+
+
+def _get_or_create(key: str, factory):
+    """Create the instance for key once per process; concurrent callers wait for it"""
+    instance = _instances.get(key)
+    if instance is not None:
+        return instance
+
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    # Per-key lock: loading the model doesn't block opening the Chroma client
+    with lock:
+        if key not in _instances:
+            with timed(key):
+                _instances[key] = factory()
+            print(f"Loaded {key} in {_timings[key]['seconds']:.2f}s")
+        return _instances[key]
+
+
+def get_embedder(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: str = None):
+    """
+    The process-wide SentenceTransformer for model_name on an embedding
+    backend (torch / onnx / onnx-int8, default from EMBEDDING_BACKEND)
+    """
+    from .embedding_backend import load_embedder, resolve_backend
+    backend = resolve_backend(backend)
+
+    return _get_or_create(
+        f"embedder:{model_name}:{backend}", lambda: load_embedder(model_name, backend)
+    )
+
+
+def get_tokenizer(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: str = None):
+    """
+    A tokenizer for the shared embedder that belongs to the calling thread.
+
+    The shared model's own tokenizer may only be used through encode():
+    tokenize() turns its truncation off and encode() turns it back on, which
+    races with encode() on request threads ("Already borrowed", or encoding
+    without truncation). Chunkers and other token counters use this instead.
+    """
+    path = get_embedder(model_name, backend).tokenizer.name_or_path
+    tokenizers = getattr(_thread_tokenizers, "by_path", None)
+    if tokenizers is None:
+        tokenizers = _thread_tokenizers.by_path = {}
+    if path not in tokenizers:
+        from transformers import AutoTokenizer
+        tokenizers[path] = AutoTokenizer.from_pretrained(path)
+    return tokenizers[path]
+
+
+def get_cross_encoder(model_name: str = DEFAULT_RERANKER_MODEL):
+    """The process-wide sentence-transformers CrossEncoder for model_name (CPU)"""
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device="cpu")
+
+    return _get_or_create(f"cross_encoder:{model_name}", load)
+
+
+def get_chroma_client(path: str = CHROMA_DB_PATH):
+    """The process-wide Chroma PersistentClient for path"""
+    def connect():
+        import chromadb
+        return chromadb.PersistentClient(path=path)
+
+    return _get_or_create(f"chroma:{os.path.abspath(path)}", connect)
+
+
+def startup_report() -> dict:
+    """What was loaded, how long it took and what it cost in memory"""
+    return {
+        "uptime_seconds": time.perf_counter() - _process_start,
+        "rss_mb": _rss_mb(),
+        "loaded": sorted(_instances),
+        "timings": dict(_timings)
+    }
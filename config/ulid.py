@@ -0,0 +1,29 @@
+import os
+import time
+
+# Crockford base32, as used by ULIDs
+_ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def new_ulid() -> str:
+    """
+    26-character ULID: 48-bit millisecond timestamp + 80 random bits.
+    Sorts by creation time and, unlike a timestamp alone, cannot collide
+    between concurrent callers.
+    """
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), "big")
+    chars = []
+    for _ in range(26):
+        value, index = divmod(value, 32)
+        chars.append(_ULID_ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+def ulid_time(ulid: str) -> float:
+    """Creation time (epoch seconds) encoded in a ULID; ValueError if it isn't one"""
+    if len(ulid) != 26 or any(c not in _ULID_ALPHABET for c in ulid):
+        raise ValueError(f"Not a ULID: {ulid!r}")
+    millis = 0
+    for c in ulid[:10]:
+        millis = millis * 32 + _ULID_ALPHABET.index(c)
+    return millis / 1000
@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from .db_client import CHROMA_DB_PATH
+from .manifest import manifest_signature
+
+DEFAULT_INDEX_DIR = os.path.join(CHROMA_DB_PATH, "vector_index")
+
+_COMPARATORS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_where(metadata: dict, where: dict) -> bool:
+    """Evaluate a Chroma `where` filter against one metadata dict"""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op not in _COMPARATORS:
+                    raise ValueError(f"Unsupported where operator '{op}'")
+                if not _COMPARATORS[op](metadata.get(key), operand):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def scoped_sections(where: dict):
+    """
+    The sections a `where` filter restricts results to (section equal to / in
+    a value, alone or inside a top-level $and), or None if it spans all.
+    """
+    if not where:
+        return None
+    conditions = where["$and"] if set(where) == {"$and"} else [{k: v} for k, v in where.items()]
+    for condition in conditions:
+        if "section" not in condition:
+            continue
+        value = condition["section"]
+        if not isinstance(value, dict):
+            return {value}
+        if set(value) == {"$eq"}:
+            return {value["$eq"]}
+        if set(value) == {"$in"}:
+            return set(value["$in"])
+    return None
+
+
+def collection_signature(collection, page_size: int = 5000) -> str:
+    """
+    What the collection's rows contain, so an export can tell it is stale
+    even when the row count is unchanged (a re-embed, or chunks replaced
+    one-for-one). Collections built by DocLoader use their manifest; others
+    hash their ids and content_hash metadata (no embeddings are fetched).
+    """
+    signature = manifest_signature(collection.name)
+    if signature is not None:
+        return "manifest:" + signature
+
+    digest = hashlib.sha256()
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            digest.update(f"{chunk_id}\0{(metadata or {}).get('content_hash', '')}\n".encode("utf-8"))
+        offset += len(page["ids"])
+    return "rows:" + digest.hexdigest()
+
+
+class MemmapVectorIndex:
+    """
+    Exact in-process vector index over a collection's embeddings.
+
+    The collection is exported once into a row-normalized float32 memmap
+    (<collection>.f32) plus a JSON sidecar with ids, documents and metadata.
+    A query is one matrix-vector product and an argpartition; a batch of
+    queries is a single GEMM. Scores are reported as the distance Chroma
+    would return for the collection's space (l2 / cosine / ip), so results
+    are drop-in compatible with CollectionManager.query_docs().
+
+    Rows are stored grouped by their "section" metadata, so a query scoped
+    to a section (see scoped_sections) only multiplies against that
+    partition's contiguous slice of the matrix.
+
+    The sidecar records the collection_signature() it was exported at;
+    open_or_build() re-exports when the collection no longer matches it.
+    """
+
+    def __init__(self, collection_name: str, base_dir: str = DEFAULT_INDEX_DIR):
+        self.collection_name = collection_name
+        base = os.path.join(base_dir, collection_name)
+        self.vectors_path = base + ".f32"
+        self.meta_path = base + ".meta.json"
+
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.documents = meta["documents"]
+        self.metadatas = meta["metadatas"]
+        self.space = meta.get("space", "l2")
+        self.dim = meta["dim"]
+        self.built_at = meta.get("built_at")
+        self.signature = meta.get("signature")
+        # section -> [start, stop) row range
+        self.partitions = meta.get("partitions", {})
+
+        self.vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim)
+        ) if self.ids else np.zeros((0, self.dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # -- build -----------------------------------------------------------------------
+
+    @staticmethod
+    def exists(collection_name: str, base_dir: str = DEFAULT_INDEX_DIR) -> bool:
+        return os.path.exists(os.path.join(base_dir, collection_name) + ".meta.json")
+
+    @classmethod
+    def build(cls, collection, base_dir: str = DEFAULT_INDEX_DIR, page_size: int = 5000):
+        """Export a Chroma collection into a fresh index (atomically replaces an old one)"""
+        start = time.perf_counter()
+        # Taken before the export: a write racing it leaves a mismatch, never a false match
+        signature = collection_signature(collection)
+        ids, documents, metadatas, chunks = [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset
+            )
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            chunks.append(np.asarray(page["embeddings"], dtype=np.float32))
+            offset += len(page["ids"])
+
+        os.makedirs(base_dir, exist_ok=True)
+        base = os.path.join(base_dir, collection.name)
+        dim = chunks[0].shape[1] if chunks else 0
+
+        # Group rows by section (stable, so order within a section is kept)
+        order = sorted(range(len(ids)), key=lambda i: (metadatas[i] or {}).get("section", ""))
+        ids = [ids[i] for i in order]
+        documents = [documents[i] for i in order]
+        metadatas = [metadatas[i] for i in order]
+        partitions = {}
+        for row, metadata in enumerate(metadatas):
+            section = (metadata or {}).get("section", "")
+            partitions.setdefault(section, [row, row])[1] = row + 1
+
+        if ids:
+            matrix = np.vstack(chunks)[order]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+            tmp_vectors = base + ".f32.tmp"
+            out = np.memmap(tmp_vectors, dtype=np.float32, mode="w+", shape=matrix.shape)
+            out[:] = matrix
+            out.flush()
+            del out
+            os.replace(tmp_vectors, base + ".f32")
+
+        meta = {
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "dim": dim,
+            "space": (collection.metadata or {}).get("hnsw:space", "l2"),
+            "partitions": partitions,
+            "signature": signature,
+            "built_at": time.time()
+        }
+        tmp_meta = base + ".meta.json.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        # The sidecar goes last: readers only ever open a complete index
+        os.replace(tmp_meta, base + ".meta.json")
+
+        print(f"Vector index '{collection.name}': {len(ids)} vectors in {time.perf_counter() - start:.2f}s")
+        return cls(collection.name, base_dir)
+
+    @classmethod
+    def open_or_build(cls, collection, base_dir: str = DEFAULT_INDEX_DIR):
+        """Open the exported index, rebuilding it when the collection's contents changed since"""
+        if cls.exists(collection.name, base_dir):
+            index = cls(collection.name, base_dir)
+            if len(index) == collection.count() and index.signature == collection_signature(collection):
+                return index
+        return cls.build(collection, base_dir)
+
+    # -- query -------------------------------------------------------------------------
+
+    def _distance(self, similarity: np.ndarray) -> np.ndarray:
+        """Cosine similarity of unit vectors -> the distance Chroma reports for this space"""
+        if self.space == "l2":
+            return 2.0 - 2.0 * similarity
+        return 1.0 - similarity
+
+    def _candidate_rows(self, where):
+        """Row indices of the partitions a filter is scoped to (None: every row)"""
+        sections = scoped_sections(where)
+        if sections is None or not self.partitions:
+            return None
+        ranges = [self.partitions[s] for s in sorted(sections) if s in self.partitions]
+        if not ranges:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, stop) for start, stop in ranges])
+
+    def _mask(self, where, row_ids):
+        if not where or (row_ids is not None and set(where) == {"section"}):
+            # No filter, or one the partition already satisfies exactly
+            return None
+        metadatas = self.metadatas if row_ids is None else [self.metadatas[i] for i in row_ids]
+        return np.fromiter(
+            (matches_where(m or {}, where) for m in metadatas), dtype=bool, count=len(metadatas)
+        )
+
+    def partition_sizes(self) -> dict:
+        return {section: stop - start for section, (start, stop) in self.partitions.items()}
+
+    def query_batch(self, query_embeddings, top_k: int = 5, where: dict = None):
+        """Top-k for many queries with one GEMM; one result list per query"""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        if len(self) == 0:
+            return [[] for _ in range(len(queries))]
+
+        # A section-scoped query only touches its partition(s) of the matrix
+        row_ids = self._candidate_rows(where)
+        vectors = self.vectors if row_ids is None else self.vectors[row_ids]
+        similarities = queries @ vectors.T
+        mask = self._mask(where, row_ids)
+        if mask is not None:
+            similarities[:, ~mask] = -np.inf
+            top_k = min(top_k, int(mask.sum()))
+        top_k = min(top_k, similarities.shape[1])
+        if top_k == 0:
+            return [[] for _ in range(len(queries))]
+
+        # Unordered top-k per row in O(N), then sort just those k
+        candidates = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+        rows = np.arange(len(queries))[:, None]
+        order = np.argsort(-similarities[rows, candidates], axis=1)
+        best = candidates[rows, order]
+        distances = self._distance(similarities[rows, best])
+        if row_ids is not None:
+            # Partition-relative columns -> index rows
+            best = row_ids[best]
+
+        return [
+            [
+                {
+                    "id": self.ids[i],
+                    "document": self.documents[i],
+                    "metadata": self.metadatas[i] or {},
+                    "filename": (self.metadatas[i] or {}).get("filename", "Unknown"),
+                    "score": float(d)
+                }
+                for i, d in zip(best_rows, best_distances)
+            ]
+            for best_rows, best_distances in zip(best.tolist(), distances.tolist())
+        ]
+
+    def query(self, query_embedding, top_k: int = 5, where: dict = None):
+        return self.query_batch([query_embedding], top_k, where)[0]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_vector_index(collection, refresh: bool = False):
+    """Process-wide index for a collection (built on first use, or when refresh=True)"""
+    with _indexes_lock:
+        index = _indexes.get(collection.name)
+        if index is None or refresh:
+            index = (
+                MemmapVectorIndex.build(collection) if refresh
+                else MemmapVectorIndex.open_or_build(collection)
+            )
+            _indexes[collection.name] = index
+        return index
+
+
+def refresh_vector_index(collection):
+    """Re-export after the collection changed, if anyone uses an index for it"""
+    if collection.name in _indexes or MemmapVectorIndex.exists(collection.name):
+        return get_vector_index(collection, refresh=True)
+    return None
+
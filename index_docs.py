@@ -3,9 +3,17 @@
 # from chroma_db.db_client import get_chroma_client
 # import sys
 # sys.path.append(r"C:\Users\rakib.uddin\Desktop\rakib\AI_Agent")
+import os
 from config.doc_loader import DocLoader
 
 
 if __name__ == "__main__":
-    loader = DocLoader(docs_dir="./docs")
+    # Offline bulk ingest: overlap reading, embedding and writing
+    loader = DocLoader(
+        docs_dir="./docs",
+        pipelined=True,
+        read_workers=int(os.environ.get("INGEST_READ_WORKERS", 8)),
+        encode_processes=int(os.environ.get("INGEST_ENCODE_PROCESSES", 0)),
+        queue_size=int(os.environ.get("INGEST_QUEUE_SIZE", 4))
+    )
     loader.load_docs()
@@ -1,39 +1,152 @@
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any, Iterator, AsyncIterator
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import re
+import threading
 
 # LangChain Core
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_core.chat_history import  InMemoryChatMessageHistory
+from langchain_core.chat_history import  InMemoryChatMessageHistory, BaseChatMessageHistory
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from langchain_core.embeddings import Embeddings
 # LangChain Community
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 
 # LangChain Ollama
 from langchain_ollama import ChatOllama
 
-import chromadb
 import logging
 
+from config.query_cache import QueryEmbeddingCache, normalize_query
+from config.answer_cache import SemanticAnswerCache, doc_signature
+from config.aliases import aliases_version, resolve_collection
+from config.bm25_index import get_bm25_index, reciprocal_rank_fusion
+from config.vector_index import scoped_sections
+from config.embedding_backend import cache_namespace
+from config.embedding_cache import get_embedding_cache
+from config.registry import get_chroma_client, get_embedder
+from session_store import SessionLocks, SessionStore, new_ulid
+from llm_scheduler import LLMScheduler, SchedulerSaturated
+from session_backends import SessionBackend, StoredChatMessageHistory
+from memory_strategies import (
+    MEMORY_STRATEGIES, SummaryMemory, count_message_tokens, get_memory_strategy
+)
+from prompt_builder import PromptBuilder
+from reranker import Reranker
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pronouns / references that point back at earlier turns ("how does it work?")
+ANAPHORA_PATTERN = re.compile(
+    r"\b(it|its|it's|they|them|their|theirs|this|that|these|those|he|she|him|her"
+    r"|the (first|second|third|last|previous|former|latter|above|same)( one)?"
+    r"|above|previous|earlier|mentioned)\b"
+)
+
+# Openers that continue the previous question ("and the events?", "what about paging?")
+FOLLOW_UP_OPENERS = re.compile(r"^(and|also|but|so|then|what about|how about|why not|same for)\b")
+
 
 class ConversationMemory:
-    """Simple conversation memory storage"""
+    """
+    Conversation memory storage.
+
+    Without a backend histories live only in this process. With a
+    SessionBackend (e.g. SQLite) they are written through to it and loaded
+    on demand, so any worker can continue any session.
+    """
     
-    def __init__(self): 
-        self.sessions: Dict[str, InMemoryChatMessageHistory] = {}
+    def __init__(self, backend: Optional[SessionBackend] = None): 
+        self.backend = backend
+        self.sessions: Dict[str, BaseChatMessageHistory] = {}
+        # Per-session strategy state, e.g. rolling summary and how far it reaches
+        self.states: Dict[str, Dict] = {}
     
-    def get_session(self, session_id: str) -> InMemoryChatMessageHistory:
+    def get_session(self, session_id: str) -> BaseChatMessageHistory:
         if session_id not in self.sessions:
-            self.sessions[session_id] = InMemoryChatMessageHistory()
+            if self.backend is not None:
+                self.sessions[session_id] = StoredChatMessageHistory(
+                    session_id, self.backend, self.backend.load_messages(session_id)
+                )
+            else:
+                self.sessions[session_id] = InMemoryChatMessageHistory()
         return self.sessions[session_id]
     
+    def get_state(self, session_id: str) -> Dict:
+        if session_id not in self.states:
+            self.states[session_id] = (
+                self.backend.load_state(session_id) if self.backend is not None else {}
+            )
+        return self.states[session_id]
+    
+    def save_state(self, session_id: str):
+        if self.backend is not None and session_id in self.states:
+            self.backend.save_state(session_id, self.states[session_id])
+    
+    def refresh(self, session_id: str):
+        """Pick up turns written by other workers since this process cached the session"""
+        if self.backend is None or not self.backend.persistent:
+            return
+        history = self.sessions.get(session_id)
+        if isinstance(history, StoredChatMessageHistory):
+            history.reload()
+        self.states.pop(session_id, None)
+    
+    def drop_session(self, session_id: str):
+        """Free everything this process holds for a session"""
+        self.sessions.pop(session_id, None)
+        self.states.pop(session_id, None)
+    
     def clear_session(self, session_id: str):
         if session_id in self.sessions:
             self.sessions[session_id].clear()
+        self.states[session_id] = {}
+        self.save_state(session_id)
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """LangChain Embeddings over an already loaded (shared) SentenceTransformer"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated queries from a QueryEmbeddingCache"""
+
+    def __init__(self, base: Embeddings, cache: QueryEmbeddingCache):
+        self.base = base
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.get_or_compute(text, self.base.embed_query)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries; every cache miss goes through one encoder call"""
+        embeddings = [self.cache.get(text) for text in texts]
+        missing = list(dict.fromkeys(
+            normalize_query(text) for text, e in zip(texts, embeddings) if e is None
+        ))
+        if missing:
+            computed = dict(zip(missing, self.base.embed_documents(missing)))
+            for key, embedding in computed.items():
+                self.cache.put(key, embedding)
+            embeddings = [
+                e if e is not None else computed[normalize_query(text)]
+                for text, e in zip(texts, embeddings)
+            ]
+        return embeddings
 
 
 class LangChainAgent:
@@ -45,7 +158,34 @@ class LangChainAgent:
         self, 
         collection_name: str = "table_rf_docs",
         model_name: str = "llama3:latest",
-        enable_tracing: bool = True
+        enable_tracing: bool = True,
+        query_cache_size: int = 1024,
+        query_cache_ttl: float = 3600,
+        enable_answer_cache: bool = False,
+        answer_cache_threshold: float = 0.95,
+        reformulation_model: Optional[str] = None,
+        memory_type: str = "buffer",
+        memory_token_budget: int = 1500,
+        max_sessions: int = 10000,
+        session_idle_ttl: float = 3600,
+        session_sweep_interval: float = 60,
+        session_backend: Optional[SessionBackend] = None,
+        llm_max_in_flight: int = 4,
+        llm_max_queue: int = 64,
+        llm_queue_timeout: float = 30,
+        reformulation_queue_timeout: float = 2,
+        embedding_backend: Optional[str] = None,
+        retrieval_engine: str = "chroma",
+        hybrid_search: bool = False,
+        hybrid_candidate_factor: int = 4,
+        rrf_k: int = 60,
+        partitioned_filters: bool = True,
+        reranker_model: Optional[str] = None,
+        rerank_candidates: int = 20,
+        rerank_budget_seconds: float = 0.3,
+        context_token_budget: Optional[int] = 1500,
+        source_token_budget: int = 300,
+        source_dedup_threshold: float = 0.95
     ):
         self.collection_name = collection_name
         self.model_name = model_name
@@ -53,20 +193,71 @@ class LangChainAgent:
         
         logger.info("🔧 Initializing LangChain Agent...")
         
-        # Initialize embeddings
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2"
+        # Initialize embeddings (repeated queries are served from an LRU cache)
+        self.query_cache = QueryEmbeddingCache(
+            max_size=query_cache_size,
+            ttl_seconds=query_cache_ttl
+        )
+        embedder = get_embedder("all-MiniLM-L6-v2", embedding_backend)
+        self.embeddings = CachedQueryEmbeddings(
+            # torch / onnx / onnx-int8 (None: EMBEDDING_BACKEND env var)
+            SentenceTransformerEmbeddings(embedder),
+            self.query_cache
+        )
+        
+        # Optional cross-encoder stage: retrieve rerank_candidates, rescore them and keep
+        # the best top_k; retrieval order is kept when the latency budget runs out
+        self.reranker = Reranker(
+            reranker_model,
+            candidates=rerank_candidates,
+            budget_seconds=rerank_budget_seconds
+        ) if reranker_model else None
+        
+        # Retrieved sources are deduplicated and trimmed to a token budget before
+        # they reach the prompt (None: whole documents, as retrieved). Chunk vectors
+        # come from the persistent cache shared with ingest; passage vectors stay
+        # in the builder's in-memory LRU.
+        chunk_cache = get_embedding_cache(
+            cache_namespace("all-MiniLM-L6-v2", embedding_backend),
+            embedder.get_sentence_embedding_dimension()
         )
+        self.prompt_builder = PromptBuilder(
+            lambda texts: chunk_cache.encode(texts, embedder.encode),
+            embedder.encode,
+            max_context_tokens=context_token_budget,
+            max_source_tokens=source_token_budget,
+            dedup_threshold=source_dedup_threshold
+        ) if context_token_budget else None
         
         # Initialize ChromaDB
-        self.chroma_client = chromadb.PersistentClient(path="./chroma_db_data")
+        self.chroma_client = get_chroma_client()
         
-        # Initialize vector store
-        self.vectorstore = Chroma(
-            client=self.chroma_client,
-            collection_name=collection_name,
-            embedding_function=self.embeddings
+        # Initialize vector store (collection_name may be an alias swapped by a reindex,
+        # possibly by another process: every retrieval checks it, see _follow_alias)
+        self._collection_lock = threading.Lock()
+        self._aliases_version = aliases_version()
+        self.vectorstore = self._open_vectorstore(resolve_collection(collection_name))
+        
+        # "memmap" serves retrieval from an exact in-process index exported from the
+        # collection (config/vector_index.py); filters it can't evaluate go to Chroma
+        if retrieval_engine not in ("chroma", "memmap"):
+            raise ValueError(f"Unknown retrieval engine '{retrieval_engine}'")
+        self.retrieval_engine = retrieval_engine
+        if retrieval_engine == "memmap":
+            self._vector_index()
+        
+        # Hybrid search: BM25 keyword hits (exact property / tag names) fused with the
+        # vector ranking by RRF; DocLoader keeps the index in step with the collection
+        self.hybrid_search = hybrid_search
+        self.bm25_index = (
+            get_bm25_index(self.vectorstore._collection) if hybrid_search else None
         )
+        self.hybrid_candidate_factor = hybrid_candidate_factor
+        self.rrf_k = rrf_k
+        
+        # Filters scoped to a section (product area) search only that section's
+        # partition of the in-process indexes instead of filtering the whole store
+        self.partitioned_filters = partitioned_filters
         
         # Initialize LLM (using ChatOllama for conversation support)
         self.llm = ChatOllama(
@@ -74,18 +265,71 @@ class LangChainAgent:
             temperature=0.7
         )
         
-        # Initialize memory
-        self.memory = ConversationMemory()
+        # Every LLM call takes a scheduler slot: bounded in-flight calls, a bounded
+        # priority queue (interactive > code_fix > background) and fast rejection
+        self.llm_scheduler = LLMScheduler(
+            max_in_flight=llm_max_in_flight,
+            max_queue=llm_max_queue,
+            queue_timeout_seconds=llm_queue_timeout
+        )
+        # Rewriting is optional, so it gives up quickly instead of queueing behind answers
+        self.reformulation_queue_timeout = reformulation_queue_timeout
+        
+        # Follow-up rewriting can run on a smaller, faster model
+        self.reformulation_model = reformulation_model or model_name
+        self.reformulation_llm = ChatOllama(
+            model=reformulation_model,
+            temperature=0
+        ) if reformulation_model else self.llm
         
-        # Store session metadata
-        self.sessions = {}
+        # Optional semantic answer cache for sessionless queries
+        self.answer_cache = SemanticAnswerCache(
+            threshold=answer_cache_threshold
+        ) if enable_answer_cache else None
+        
+        # Initialize memory; each session picks a strategy (buffer / window / summary).
+        # A persistent session_backend shares sessions across workers and restarts.
+        self.session_backend = session_backend
+        self.memory = ConversationMemory(backend=session_backend)
+        self.default_memory_type = get_memory_strategy(memory_type).name
+        self.memory_strategies = {
+            name: get_memory_strategy(name, max_tokens=memory_token_budget)
+            for name in MEMORY_STRATEGIES
+        }
+        # Rolling summaries are produced off the request path
+        self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+        self._summarizing = set()
+        
+        # Store session metadata: idle sessions expire, the oldest are evicted past the cap
+        self.sessions = SessionStore(
+            max_sessions=max_sessions,
+            idle_ttl_seconds=session_idle_ttl,
+            sweep_interval_seconds=session_sweep_interval,
+            on_evict=self._on_session_evicted,
+            backend=session_backend
+        )
+        self.sessions.start_sweeper()
+        # Turns within one session run one at a time; sessions run in parallel
+        self.session_locks = SessionLocks()
         
         logger.info("✅ LangChain Agent initialized")
         logger.info(f"📊 Documents: {self.vectorstore._collection.count()}")
 
-    def create_session(self, user_id: Optional[str] = None) -> str:
+    def create_session(
+        self, 
+        user_id: Optional[str] = None, 
+        memory_type: Optional[str] = None
+    ) -> str:
         """Create a new conversation session"""
-        session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        memory_type = memory_type or self.default_memory_type
+        if memory_type not in self.memory_strategies:
+            raise ValueError(
+                f"Unknown memory type '{memory_type}'. "
+                f"Choose one of: {', '.join(self.memory_strategies)}"
+            )
+        
+        # Random (ULID) ids: timestamp-only ids collide under concurrent creation
+        session_id = f"session_{new_ulid()}"
         
         # Create memory for this session
         self.memory.get_session(session_id)
@@ -94,28 +338,52 @@ class LangChainAgent:
         self.sessions[session_id] = {
             "created_at": datetime.now().isoformat(),
             "user_id": user_id,
-            "interaction_count": 0,
-            "trace_log": []
+            "memory_type": memory_type,
+            "interaction_count": 0
         }
         
         logger.info(f"📝 Session created: {session_id}")
         return session_id
 
-    def _reformulate_question(
+    def _on_session_evicted(self, session_id: str, reason: str):
+        """Release chat history and memory state of a removed session"""
+        self.memory.drop_session(session_id)
+        if reason != "deleted":
+            logger.info(f"♻️ Session {session_id} evicted ({reason})")
+
+    def _needs_reformulation(
         self, 
         question: str, 
         chat_history: List[BaseMessage]
-    ) -> str:
+    ) -> Tuple[bool, str]:
         """
-        Reformulate follow-up questions to be standalone using chat history
+        Cheap pre-check deciding whether a question depends on earlier turns.
+        Returns (needed, reason); only dependent questions pay for an LLM rewrite.
         """
-        if not chat_history:
-            return question
-        
         # Only reformulate if there's previous context
-        if len(chat_history) < 2:
-            return question
+        if not chat_history or len(chat_history) < 2:
+            return False, "no_history"
+        
+        text = question.strip().lower()
         
+        if FOLLOW_UP_OPENERS.match(text):
+            return True, "continuation"
+        
+        if ANAPHORA_PATTERN.search(text):
+            return True, "anaphora"
+        
+        # Fragments like "why?" or "any examples?" only make sense in context
+        if len(text.split()) <= 2:
+            return True, "short_follow_up"
+        
+        return False, "standalone"
+
+    def _reformulation_prompt(
+        self, 
+        question: str, 
+        chat_history: List[BaseMessage]
+    ) -> str:
+        """Prompt for rewriting a follow-up as a standalone question"""
         # Build context from recent messages
         recent_messages = chat_history[-4:]  # Last 2 exchanges
         context = "\n".join([
@@ -123,7 +391,7 @@ class LangChainAgent:
             for msg in recent_messages
         ])
         
-        reformulate_prompt = f"""Given the conversation history below, reformulate the follow-up question to be a standalone question that includes all necessary context.
+        return f"""Given the conversation history below, reformulate the follow-up question to be a standalone question that includes all necessary context.
 
 Conversation History:
 {context}
@@ -131,21 +399,112 @@ Conversation History:
 Follow-up Question: {question}
 
 Standalone Question (keep it concise and clear):"""
+
+    def _accept_reformulation(self, question: str, reformulated: str) -> str:
+        reformulated = reformulated.strip()
+        
+        # If reformulation failed or is too similar, use original
+        if not reformulated or reformulated == question:
+            return question
+        
+        logger.info(f"🔄 Reformulated: '{question}' → '{reformulated}'")
+        return reformulated
+
+    def _reformulate_question(
+        self, 
+        question: str, 
+        chat_history: List[BaseMessage]
+    ) -> Tuple[str, Dict]:
+        """
+        Reformulate follow-up questions to be standalone using chat history.
+        Returns (question, info) where info records the path taken for the trace.
+        """
+        start = datetime.now()
+        needed, reason = self._needs_reformulation(question, chat_history)
+        if not needed:
+            return question, {"path": "skipped", "reason": reason, "seconds": 0.0}
+        
+        reformulate_prompt = self._reformulation_prompt(question, chat_history)
+        info = {"path": "llm", "reason": reason, "model": self.reformulation_model}
         
         try:
-            response = self.llm.invoke([HumanMessage(content=reformulate_prompt)])
-            reformulated = response.content.strip()
-            
-            # If reformulation failed or is too similar, use original
-            if not reformulated or reformulated == question:
-                return question
+            with self.llm_scheduler.slot("background", timeout=self.reformulation_queue_timeout):
+                response = self.reformulation_llm.invoke([HumanMessage(content=reformulate_prompt)])
+            question = self._accept_reformulation(question, response.content)
             
-            logger.info(f"🔄 Reformulated: '{question}' → '{reformulated}'")
-            return reformulated
+        except SchedulerSaturated as e:
+            logger.info(f"Skipping reformulation, LLM is busy: {e}")
+            info["path"] = "shed"
+        except Exception as e:
+            logger.warning(f"Failed to reformulate question: {e}")
+            info["path"] = "failed"
+        
+        info["seconds"] = (datetime.now() - start).total_seconds()
+        return question, info
+
+    async def _areformulate_question(
+        self, 
+        question: str, 
+        chat_history: List[BaseMessage]
+    ) -> Tuple[str, Dict]:
+        """Async variant of _reformulate_question()"""
+        start = datetime.now()
+        needed, reason = self._needs_reformulation(question, chat_history)
+        if not needed:
+            return question, {"path": "skipped", "reason": reason, "seconds": 0.0}
+        
+        reformulate_prompt = self._reformulation_prompt(question, chat_history)
+        info = {"path": "llm", "reason": reason, "model": self.reformulation_model}
+        
+        try:
+            async with self.llm_scheduler.aslot("background", timeout=self.reformulation_queue_timeout):
+                response = await self.reformulation_llm.ainvoke(
+                    [HumanMessage(content=reformulate_prompt)]
+                )
+            question = self._accept_reformulation(question, response.content)
             
+        except SchedulerSaturated as e:
+            logger.info(f"Skipping reformulation, LLM is busy: {e}")
+            info["path"] = "shed"
         except Exception as e:
             logger.warning(f"Failed to reformulate question: {e}")
-            return question
+            info["path"] = "failed"
+        
+        info["seconds"] = (datetime.now() - start).total_seconds()
+        return question, info
+
+    def _open_vectorstore(self, physical_name: str) -> Chroma:
+        return Chroma(
+            client=self.chroma_client,
+            collection_name=physical_name,
+            embedding_function=self.embeddings
+        )
+
+    def reload_collection(self) -> str:
+        """
+        Re-resolve the collection alias and rebind to its current target
+        (after an index swap). Queries already running finish on the old one.
+        """
+        with self._collection_lock:
+            self._aliases_version = aliases_version()
+            physical_name = resolve_collection(self.collection_name)
+            if physical_name != self.vectorstore._collection.name:
+                logger.info(
+                    f"🔁 Collection '{self.collection_name}': "
+                    f"{self.vectorstore._collection.name} -> {physical_name}"
+                )
+                vectorstore = self._open_vectorstore(physical_name)
+                if self.hybrid_search:
+                    self.bm25_index = get_bm25_index(vectorstore._collection)
+                self.vectorstore = vectorstore
+                if self.answer_cache is not None:
+                    self.answer_cache.invalidate()
+            return physical_name
+
+    def _follow_alias(self):
+        """Rebind when the alias file changed since we last resolved it (one stat call)"""
+        if aliases_version() != self._aliases_version:
+            self.reload_collection()
 
     def _retrieve_documents(
         self, 
@@ -153,9 +512,19 @@ Standalone Question (keep it concise and clear):"""
         top_k: int = 5,
         filter_metadata: Optional[Dict] = None
     ) -> List[Dict]:
-        """Retrieve relevant documents from vector store"""
+        """Retrieve relevant documents from vector store (fused with BM25 when hybrid)"""
         
         logger.info(f"🔍 Searching for: {query[:100]}...")
+        self._follow_alias()
+        
+        if (
+            self.retrieval_engine == "memmap" or self.bm25_index is not None
+            or self._uses_partitions(filter_metadata)
+        ):
+            hits = self._search([query], [self.embeddings.embed_query(query)], top_k, filter_metadata)[0]
+            results = self._format_sources([(h["document"], h["metadata"]) for h in hits])
+            logger.info(f"📚 Retrieved {len(results)} documents ({self._retrieval_mode()})")
+            return results
         
         # Build search kwargs
         search_kwargs = {"k": top_k}
@@ -165,33 +534,169 @@ Standalone Question (keep it concise and clear):"""
         # Search
         docs = self.vectorstore.similarity_search(query, **search_kwargs)
         
-        # Format results
+        results = self._format_sources([(doc.page_content, doc.metadata) for doc in docs])
+        
+        logger.info(f"📚 Retrieved {len(results)} documents")
+        return results
+
+    def _vector_index(self):
+        """Process-wide memmap index of the current collection (built on first use)"""
+        from config.vector_index import get_vector_index
+        return get_vector_index(self.vectorstore._collection)
+
+    def _candidate_k(self, top_k: int) -> int:
+        """How many chunks to retrieve: a wider set when a reranker picks the top_k"""
+        return max(top_k, self.reranker.candidates) if self.reranker is not None else top_k
+
+    def _uses_partitions(self, filter_metadata: Optional[Dict]) -> bool:
+        return self.partitioned_filters and scoped_sections(filter_metadata) is not None
+
+    def _retrieval_mode(self) -> str:
+        mode = self.retrieval_engine
+        return f"{mode}+bm25" if self.bm25_index is not None else mode
+
+    def _vector_hits(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        filter_metadata: Optional[Dict]
+    ) -> List[List[Dict]]:
+        """Nearest chunks per query as id/document/metadata dicts, best first"""
+        if self.retrieval_engine == "memmap" or self._uses_partitions(filter_metadata):
+            try:
+                return self._vector_index().query_batch(query_embeddings, top_k, where=filter_metadata)
+            except ValueError as e:
+                logger.info(f"Vector index can't evaluate filter, using Chroma: {e}")
+        
+        response = self.vectorstore._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            where=filter_metadata or None,
+            include=["documents", "metadatas"]
+        )
+        return [
+            [
+                {"id": i, "document": d, "metadata": m or {}}
+                for i, d, m in zip(ids, documents, metadatas)
+            ]
+            for ids, documents, metadatas in zip(
+                response["ids"], response["documents"], response["metadatas"]
+            )
+        ]
+
+    def _search(
+        self,
+        queries: List[str],
+        query_embeddings: List[List[float]],
+        top_k: int,
+        filter_metadata: Optional[Dict]
+    ) -> List[List[Dict]]:
+        """
+        Vector hits per query; in hybrid mode both rankers return a deeper
+        candidate list and the two are merged by reciprocal rank fusion, so a
+        chunk matching an exact property or tag name surfaces even when its
+        embedding is only a middling match.
+        """
+        if self.bm25_index is None:
+            return self._vector_hits(query_embeddings, top_k, filter_metadata)
+        
+        depth = top_k * self.hybrid_candidate_factor
+        vector_hits = self._vector_hits(query_embeddings, depth, filter_metadata)
+        fused = []
+        for query, hits in zip(queries, vector_hits):
+            try:
+                keyword_hits = self.bm25_index.search(query, depth, where=filter_metadata)
+            except ValueError as e:
+                logger.info(f"BM25 index can't evaluate filter, vector results only: {e}")
+                keyword_hits = []
+            fused.append(reciprocal_rank_fusion([hits, keyword_hits], top_k, k=self.rrf_k))
+        return fused
+
+    @staticmethod
+    def _format_sources(hits: List[Tuple[str, Dict]]) -> List[Dict]:
+        """Shape (text, metadata) hits, best first, into source dicts"""
         results = []
-        for i, doc in enumerate(docs):
+        for i, (document, metadata) in enumerate(hits):
+            metadata = metadata or {}
             results.append({
                 "rank": i + 1,
-                "document": doc.page_content,
-                "metadata": doc.metadata,
-                "filename": doc.metadata.get("filename", "Unknown"),
+                "document": document,
+                "metadata": metadata,
+                "filename": metadata.get("filename", "Unknown"),
+                "heading": metadata.get("heading_path", ""),
                 "relevance_note": f"Source {i+1}"
             })
-        
-        logger.info(f"📚 Retrieved {len(results)} documents")
         return results
 
-    def ask(
-        self, 
-        query: str, 
-        session_id: Optional[str] = None,
+    def _retrieve_documents_batch(
+        self,
+        queries: List[str],
         top_k: int = 5,
         filter_metadata: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """Retrieve for many queries with one encoder call and one vector query"""
+        logger.info(f"🔍 Batch search for {len(queries)} queries...")
+        self._follow_alias()
+        
+        query_embeddings = self.embeddings.embed_queries(queries)
+        
+        return [
+            self._format_sources([(h["document"], h["metadata"]) for h in hits])
+            for hits in self._search(queries, query_embeddings, top_k, filter_metadata)
+        ]
+
+    def _prepare_answer(
+        self,
+        query: str,
+        session_id: Optional[str],
+        top_k: int,
+        filter_metadata: Optional[Dict]
     ) -> Dict:
         """
-        Ask a question with full conversation context
+        Steps shared by ask() and ask_stream(): session lookup, reformulation,
+        retrieval, answer-cache check and prompt assembly.
         """
+        turn = self._start_turn(query, session_id)
+        
+        # Step 1: Reformulate question with context
+        reformulated_question, turn["reformulation"] = self._reformulate_question(
+            query, 
+            turn["chat_history"].messages
+        )
+        
+        return self._build_answer_context(turn, reformulated_question, top_k, filter_metadata)
+
+    async def _aprepare_answer(
+        self,
+        query: str,
+        session_id: Optional[str],
+        top_k: int,
+        filter_metadata: Optional[Dict]
+    ) -> Dict:
+        """Async variant of _prepare_answer(); blocking retrieval runs on an executor"""
+        turn = self._start_turn(query, session_id)
+        
+        reformulated_question, turn["reformulation"] = await self._areformulate_question(
+            query, 
+            turn["chat_history"].messages
+        )
+        
+        return await asyncio.to_thread(
+            self._build_answer_context, turn, reformulated_question, top_k, filter_metadata
+        )
+
+    def _start_turn(self, query: str, session_id: Optional[str]) -> Dict:
+        """Resolve (or create) the session for a new turn"""
+        # Without prior context the answer depends only on query + docs, so it is cacheable
+        sessionless = session_id is None or session_id not in self.sessions
+        
         # Create session if needed
-        if session_id is None or session_id not in self.sessions:
+        if sessionless:
             session_id = self.create_session()
+        elif self.session_backend is not None:
+            # Another worker may have served the previous turn
+            self.sessions.refresh(session_id)
+            self.memory.refresh(session_id)
         
         session = self.sessions[session_id]
         chat_history = self.memory.get_session(session_id)
@@ -202,101 +707,538 @@ Standalone Question (keep it concise and clear):"""
         logger.info(f"💬 Interaction: {session['interaction_count'] + 1}")
         logger.info(f"{'='*70}")
         
-        start_time = datetime.now()
+        return {
+            "query": query,
+            "session_id": session_id,
+            "session": session,
+            "chat_history": chat_history,
+            "sessionless": sessionless,
+            "start_time": datetime.now()
+        }
+
+    def _ephemeral_turn(self, query: str) -> Dict:
+        """
+        One-off sessionless turn for batch questions: empty history, never
+        registered in the session store, persisted or appended to a trace_log
+        """
+        return {
+            "query": query,
+            "session_id": None,
+            "session": {"memory_type": self.default_memory_type, "interaction_count": 0},
+            "chat_history": InMemoryChatMessageHistory(),
+            "sessionless": True,
+            "ephemeral": True,
+            "start_time": datetime.now()
+        }
+
+    def _build_answer_context(
+        self,
+        turn: Dict,
+        reformulated_question: str,
+        top_k: int,
+        filter_metadata: Optional[Dict],
+        sources: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        Retrieval, answer-cache check and prompt assembly (blocking: embeds and
+        hits Chroma). Batch callers pass sources they already retrieved.
+        """
+        query = turn["query"]
+        sessionless = turn["sessionless"]
+        chat_history = turn["chat_history"]
         
-        try:
-            # Step 1: Reformulate question with context
-            reformulated_question = self._reformulate_question(
-                query, 
-                chat_history.messages
-            )
-            
-            # Step 2: Retrieve relevant documents
+        # Step 2: Retrieve relevant documents
+        if sources is None:
             sources = self._retrieve_documents(
                 reformulated_question, 
-                top_k=top_k,
+                top_k=self._candidate_k(top_k),
                 filter_metadata=filter_metadata
             )
-            
-            # Step 3: Build context from documents
-            doc_context = "\n\n".join([
-                f"[Source {s['rank']}: {s['filename']}]\n{s['document']}"
-                for s in sources
-            ])
-            
-            # Step 4: Build prompt with chat history
-            messages = [
-                SystemMessage(content="""You are an expert assistant with access to documentation. 
+        
+        # Step 2a: Rescore the wider candidate set, keep the best top_k
+        rerank_info = None
+        if self.reranker is not None:
+            sources, rerank_info = self.reranker.rerank(reformulated_question, sources, top_k)
+            logger.info(
+                f"🔀 Rerank {rerank_info['status']} over {rerank_info['candidates']} candidates "
+                f"in {rerank_info['seconds']:.3f}s"
+            )
+        
+        # Step 2b: Reuse a cached answer for a near-identical sessionless query
+        cached_answer = None
+        query_embedding = None
+        signature = None
+        answer_cache_status = "disabled"
+        if self.answer_cache is not None and sessionless:
+            query_embedding = self.embeddings.embed_query(reformulated_question)
+            signature = doc_signature(sources)
+            cached = self.answer_cache.lookup(query_embedding, signature)
+            if cached is not None:
+                cached_answer = cached["answer"]
+                answer_cache_status = "hit"
+                logger.info(f"♻️ Answer cache hit (similarity {cached['similarity']:.3f})")
+            else:
+                answer_cache_status = "miss"
+        elif self.answer_cache is not None:
+            answer_cache_status = "bypass"
+        
+        # Step 3: Build context from documents, within the token budget
+        context_stats = None
+        if self.prompt_builder is not None and sources and cached_answer is None:
+            sources, context_stats = self.prompt_builder.build(
+                query_embedding or self.embeddings.embed_query(reformulated_question), sources
+            )
+            logger.info(
+                f"✂️ Context {context_stats['context_tokens_before']} -> "
+                f"{context_stats['context_tokens_after']} tokens "
+                f"({context_stats['duplicates_removed']} duplicates, "
+                f"{context_stats['sources_truncated']} trimmed)"
+            )
+        doc_context = "\n\n".join([
+            f"[Source {s['rank']}: {s['filename']}]\n{s['document']}"
+            for s in sources
+        ])
+        
+        # Step 4: Build prompt with chat history
+        messages = [
+            SystemMessage(content="""You are an expert assistant with access to documentation. 
 Answer questions based on the provided context and conversation history.
 Always cite the source documents you used.
 If you don't know the answer, say so clearly.""")
-            ]
-            
-            # Add chat history
-            messages.extend(chat_history.messages)
-            
-            # Add current query with context
-            current_query = f"""Context from documentation:
+        ]
+        
+        # Add chat history, trimmed/summarized by the session's memory strategy
+        strategy = self._memory_strategy(turn["session"])
+        history = strategy.select(
+            chat_history.messages,
+            {} if turn.get("ephemeral") else self.memory.get_state(turn["session_id"])
+        )
+        messages.extend(history)
+        
+        # Add current query with context
+        current_query = f"""Context from documentation:
 {doc_context}
 
 Question: {query}
 
 Please provide a detailed answer based on the context above."""
+        
+        messages.append(HumanMessage(content=current_query))
+        
+        return {
+            **turn,
+            "reformulated_question": reformulated_question,
+            "sources": sources,
+            "messages": messages,
+            "cached_answer": cached_answer,
+            "query_embedding": query_embedding,
+            "signature": signature,
+            "answer_cache_status": answer_cache_status,
+            "history_messages_in_prompt": len(history),
+            "prompt_tokens_estimated": count_message_tokens(messages),
+            "rerank": rerank_info,
+            "context": context_stats
+        }
+
+    def _memory_strategy(self, session: Dict):
+        return self.memory_strategies[session.get("memory_type", self.default_memory_type)]
+
+    def _maybe_compress_memory(self, session_id: str):
+        """Schedule a background summary update once older turns outgrow the budget"""
+        strategy = self._memory_strategy(self.sessions[session_id])
+        messages = self.memory.get_session(session_id).messages
+        state = self.memory.get_state(session_id)
+        
+        if session_id in self._summarizing or not strategy.needs_compression(messages, state):
+            return
+        
+        self._summarizing.add(session_id)
+        self._summarizer.submit(self._compress_memory, session_id, strategy)
+
+    def _compress_memory(self, session_id: str, strategy: SummaryMemory):
+        """Fold older turns into the session's rolling summary (runs on the summarizer thread)"""
+        try:
+            # The session may have been evicted since the job was queued
+            if session_id not in self.memory.sessions:
+                return
+            messages = list(self.memory.get_session(session_id).messages)
+            state = self.memory.get_state(session_id)
+            cut = strategy.split_for_compression(messages, state)
+            if cut is None:
+                return
             
-            messages.append(HumanMessage(content=current_query))
+            prompt = strategy.summary_prompt(
+                state.get("summary", ""), messages[state.get("summarized_upto", 0):cut]
+            )
+            with self.llm_scheduler.slot("background"):
+                response = self.reformulation_llm.invoke([HumanMessage(content=prompt)])
             
-            # Step 5: Get answer from LLM
+            # The session may have been cleared or evicted while we were summarizing
+            history = self.memory.sessions.get(session_id)
+            if history is not None and len(history.messages) >= cut:
+                # One update so a concurrent turn never sees a half-written state
+                state.update(summary=response.content.strip(), summarized_upto=cut)
+                self.memory.save_state(session_id)
+                logger.info(f"🧠 Summarized {cut} messages for {session_id}")
+        except Exception as e:
+            logger.warning(f"Failed to summarize memory for {session_id}: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+
+    @staticmethod
+    def _prompt_tokens(usage: Optional[Dict]) -> Optional[int]:
+        """Actual prompt token count reported by the model server, if any"""
+        if not usage:
+            return None
+        return usage.get("input_tokens")
+
+    def _finalize_answer(self, prepared: Dict, answer: str, usage: Optional[Dict] = None) -> Dict:
+        """Save the finished answer to memory, cache and trace; build the response"""
+        session_id = prepared["session_id"]
+        session = prepared["session"]
+        chat_history = prepared["chat_history"]
+        query = prepared["query"]
+        
+        if prepared["answer_cache_status"] == "miss":
+            self.answer_cache.store(
+                prepared["query_embedding"], prepared["signature"], {"answer": answer}
+            )
+        
+        # Step 6: Save to memory (batch turns have no session to save into)
+        ephemeral = prepared.get("ephemeral", False)
+        if not ephemeral:
+            chat_history.add_user_message(query)
+            chat_history.add_ai_message(answer)
+        
+        # Calculate duration
+        duration = (datetime.now() - prepared["start_time"]).total_seconds()
+        
+        # Build trace info
+        trace_info = {
+            "session_id": session_id,
+            "timestamp": datetime.now().isoformat(),
+            "original_question": query,
+            "reformulated_question": prepared["reformulated_question"],
+            "documents_retrieved": len(prepared["sources"]),
+            "retrieval_mode": self._retrieval_mode(),
+            "processing_time_seconds": duration,
+            "interaction_number": session["interaction_count"] + 1,
+            "answer_cache": prepared["answer_cache_status"],
+            "reformulation": prepared["reformulation"],
+            "memory_type": session.get("memory_type", self.default_memory_type),
+            "history_messages_in_prompt": prepared["history_messages_in_prompt"],
+            "prompt_tokens": self._prompt_tokens(usage),
+            "prompt_tokens_estimated": prepared["prompt_tokens_estimated"],
+            "rerank": prepared["rerank"],
+            "context": prepared["context"]
+        }
+        if "time_to_first_token_seconds" in prepared:
+            trace_info["time_to_first_token_seconds"] = prepared["time_to_first_token_seconds"]
+        
+        # Update session
+        if not ephemeral:
+            session["interaction_count"] += 1
+            self.sessions.save(session_id)
+            self.sessions.append_trace(session_id, trace_info)
+            
+            self._maybe_compress_memory(session_id)
+        
+        logger.info(f"✅ Answer generated in {duration:.2f}s")
+        
+        # Build response
+        return {
+            "answer": answer,
+            "sources": prepared["sources"],
+            "trace": trace_info,
+            "session_id": session_id,
+            "reformulated_question": prepared["reformulated_question"],
+            "memory_summary": self._get_memory_summary(session_id)
+        }
+
+    def _answer_prepared(self, prepared: Dict, priority: str = "interactive") -> Dict:
+        """Step 5: get the answer from the LLM (unless cached) and finalize the turn"""
+        answer = prepared["cached_answer"]
+        usage = None
+        if answer is None:
             logger.info(f"🤖 Generating answer...")
-            response = self.llm.invoke(messages)
+            with self.llm_scheduler.slot(priority):
+                response = self.llm.invoke(prepared["messages"])
             answer = response.content
+            usage = response.usage_metadata
+        
+        return self._finalize_answer(prepared, answer, usage)
+
+    async def _aanswer_prepared(self, prepared: Dict, priority: str = "interactive") -> Dict:
+        """Async variant of _answer_prepared()"""
+        answer = prepared["cached_answer"]
+        usage = None
+        if answer is None:
+            logger.info(f"🤖 Generating answer...")
+            async with self.llm_scheduler.aslot(priority):
+                response = await self.llm.ainvoke(prepared["messages"])
+            answer = response.content
+            usage = response.usage_metadata
+        
+        return self._finalize_answer(prepared, answer, usage)
+
+    def ask(
+        self, 
+        query: str, 
+        session_id: Optional[str] = None,
+        top_k: int = 5,
+        filter_metadata: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Ask a question with full conversation context
+        """
+        try:
+            with self.session_locks.hold(session_id):
+                prepared = self._prepare_answer(query, session_id, top_k, filter_metadata)
+                return self._answer_prepared(prepared)
             
-            # Step 6: Save to memory
-            chat_history.add_user_message(query)
-            chat_history.add_ai_message(answer)
+        except Exception as e:
+            logger.error(f"❌ Error: {e}")
+            raise
+
+    def ask_stream(
+        self, 
+        query: str, 
+        session_id: Optional[str] = None,
+        top_k: int = 5,
+        filter_metadata: Optional[Dict] = None
+    ) -> Iterator[Dict]:
+        """
+        Streaming variant of ask(). Yields events:
+        {"type": "start", ...} once retrieval is done, {"type": "token", "content": ...}
+        per generated chunk, then {"type": "done", ...} with the same payload as
+        ask() (minus the answer text). Memory and trace are updated only after
+        the stream completes.
+        """
+        try:
+            with self.session_locks.hold(session_id):
+                prepared = self._prepare_answer(query, session_id, top_k, filter_metadata)
             
-            # Calculate duration
-            duration = (datetime.now() - start_time).total_seconds()
+                yield {
+                    "type": "start",
+                    "session_id": prepared["session_id"],
+                    "reformulated_question": prepared["reformulated_question"],
+                    "sources": prepared["sources"]
+                }
             
-            # Build trace info
-            trace_info = {
-                "session_id": session_id,
-                "timestamp": datetime.now().isoformat(),
-                "original_question": query,
-                "reformulated_question": reformulated_question,
-                "documents_retrieved": len(sources),
-                "processing_time_seconds": duration,
-                "interaction_number": session["interaction_count"] + 1
-            }
+                usage = None
+                if prepared["cached_answer"] is not None:
+                    answer = prepared["cached_answer"]
+                    yield {"type": "token", "content": answer}
+                else:
+                    logger.info(f"🤖 Streaming answer...")
+                    parts = []
+                    with self.llm_scheduler.slot("interactive"):
+                        stream = self.llm.stream(prepared["messages"])
+                        try:
+                            for chunk in stream:
+                                # Ollama reports token usage on the final chunk
+                                if chunk.usage_metadata:
+                                    usage = chunk.usage_metadata
+                                if not chunk.content:
+                                    continue
+                                if not parts:
+                                    prepared["time_to_first_token_seconds"] = (
+                                        datetime.now() - prepared["start_time"]
+                                    ).total_seconds()
+                                parts.append(chunk.content)
+                                yield {"type": "token", "content": chunk.content}
+                        finally:
+                            # A consumer that stops early closes us here; end the Ollama
+                            # request before the slot and session lock are released
+                            stream.close()
+                    answer = "".join(parts)
             
-            # Update session
-            session["interaction_count"] += 1
-            session["trace_log"].append(trace_info)
+                result = self._finalize_answer(prepared, answer, usage)
+                result.pop("answer")
+                yield {"type": "done", **result}
             
-            logger.info(f"✅ Answer generated in {duration:.2f}s")
+        except Exception as e:
+            logger.error(f"❌ Error: {e}")
+            raise
+
+    async def aask(
+        self, 
+        query: str, 
+        session_id: Optional[str] = None,
+        top_k: int = 5,
+        filter_metadata: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Async variant of ask(): the LLM is awaited via ainvoke and embedding /
+        Chroma work runs on an executor, so the event loop stays free
+        """
+        try:
+            async with self.session_locks.ahold(session_id):
+                prepared = await self._aprepare_answer(query, session_id, top_k, filter_metadata)
+                return await self._aanswer_prepared(prepared)
             
-            # Build response
-            return {
-                "answer": answer,
-                "sources": sources,
-                "trace": trace_info,
-                "session_id": session_id,
-                "reformulated_question": reformulated_question,
-                "memory_summary": self._get_memory_summary(session_id)
-            }
+        except Exception as e:
+            logger.error(f"❌ Error: {e}")
+            raise
+
+    async def aask_stream(
+        self, 
+        query: str, 
+        session_id: Optional[str] = None,
+        top_k: int = 5,
+        filter_metadata: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        """Async variant of ask_stream() built on ChatOllama.astream"""
+        try:
+            async with self.session_locks.ahold(session_id):
+                prepared = await self._aprepare_answer(query, session_id, top_k, filter_metadata)
+            
+                yield {
+                    "type": "start",
+                    "session_id": prepared["session_id"],
+                    "reformulated_question": prepared["reformulated_question"],
+                    "sources": prepared["sources"]
+                }
+            
+                usage = None
+                if prepared["cached_answer"] is not None:
+                    answer = prepared["cached_answer"]
+                    yield {"type": "token", "content": answer}
+                else:
+                    logger.info(f"🤖 Streaming answer...")
+                    parts = []
+                    async with self.llm_scheduler.aslot("interactive"):
+                        stream = self.llm.astream(prepared["messages"])
+                        try:
+                            async for chunk in stream:
+                                # Ollama reports token usage on the final chunk
+                                if chunk.usage_metadata:
+                                    usage = chunk.usage_metadata
+                                if not chunk.content:
+                                    continue
+                                if not parts:
+                                    prepared["time_to_first_token_seconds"] = (
+                                        datetime.now() - prepared["start_time"]
+                                    ).total_seconds()
+                                parts.append(chunk.content)
+                                yield {"type": "token", "content": chunk.content}
+                        finally:
+                            await stream.aclose()
+                    answer = "".join(parts)
+            
+                result = self._finalize_answer(prepared, answer, usage)
+                result.pop("answer")
+                yield {"type": "done", **result}
             
         except Exception as e:
             logger.error(f"❌ Error: {e}")
             raise
 
-    def fix_code(
+    def _prepare_batch(
+        self,
+        queries: List[str],
+        top_k: int,
+        filter_metadata: Optional[Dict]
+    ) -> List[Dict]:
+        """
+        Prepare independent (sessionless) turns for many questions at once:
+        one encoder call and one multi-query Chroma lookup for the whole batch
+        """
+        all_sources = self._retrieve_documents_batch(
+            queries, self._candidate_k(top_k), filter_metadata
+        )
+        
+        prepared = []
+        for query, sources in zip(queries, all_sources):
+            turn = self._ephemeral_turn(query)
+            # No history, so this never calls the LLM
+            reformulated_question, turn["reformulation"] = self._reformulate_question(
+                query, turn["chat_history"].messages
+            )
+            prepared.append(self._build_answer_context(
+                turn, reformulated_question, top_k, filter_metadata, sources=sources
+            ))
+        return prepared
+
+    @staticmethod
+    def _batch_item(index: int, query: str, result: Optional[Dict], error: Optional[Exception]) -> Dict:
+        if error is not None:
+            logger.error(f"❌ Batch query {index} failed: {error}")
+            return {"index": index, "query": query, "error": str(error)}
+        return {"index": index, "query": query, **result}
+
+    def ask_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filter_metadata: Optional[Dict] = None,
+        max_concurrency: int = 4,
+        ordered: bool = True
+    ) -> Iterator[Dict]:
+        """
+        Answer many independent questions (evaluation / cache pre-warm runs).
+
+        Embedding and retrieval are amortized over the whole batch; at most
+        max_concurrency LLM generations run at once. Yields one item per
+        query, {"index", "query", **ask() result} or {"index", "query",
+        "error"}, in input order or, with ordered=False, as they complete.
+        """
+        prepared = self._prepare_batch(queries, top_k, filter_metadata)
+        
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="batch-llm") as pool:
+            futures = {
+                pool.submit(self._answer_prepared, p, "background"): i
+                for i, p in enumerate(prepared)
+            }
+            try:
+                for future in (futures if ordered else as_completed(futures)):
+                    index = futures[future]
+                    error = future.exception()
+                    yield self._batch_item(
+                        index, queries[index], None if error else future.result(), error
+                    )
+            finally:
+                # Consumer stopped early: don't start the remaining generations
+                for future in futures:
+                    future.cancel()
+
+    async def aask_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filter_metadata: Optional[Dict] = None,
+        max_concurrency: int = 4,
+        ordered: bool = True
+    ) -> AsyncIterator[Dict]:
+        """Async variant of ask_batch(); generations are bounded by a semaphore"""
+        prepared = await asyncio.to_thread(self._prepare_batch, queries, top_k, filter_metadata)
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(index: int, turn: Dict):
+            async with semaphore:
+                try:
+                    return index, await self._aanswer_prepared(turn, "background"), None
+                except Exception as e:
+                    return index, None, e
+        
+        tasks = [asyncio.create_task(run(i, p)) for i, p in enumerate(prepared)]
+        try:
+            for next_done in (tasks if ordered else asyncio.as_completed(tasks)):
+                index, result, error = await next_done
+                yield self._batch_item(index, queries[index], result, error)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _prepare_fix(
         self,
         code: str,
         error_message: str,
-        language: str = "python",
-        session_id: Optional[str] = None
+        language: str,
+        session_id: Optional[str]
     ) -> Dict:
-        """Fix code errors with context from documentation"""
-        
+        """Session lookup, doc retrieval and prompt for fix_code()/fix_code_stream()"""
         if session_id is None or session_id not in self.sessions:
             session_id = self.create_session()
         
@@ -332,32 +1274,149 @@ Please provide:
 
 Be specific and clear."""
         
-        # Get fix
-        response = self.llm.invoke([HumanMessage(content=fix_prompt)])
-        full_response = response.content
+        return {
+            "session_id": session_id,
+            "error_message": error_message,
+            "language": language,
+            "sources": sources,
+            "messages": [HumanMessage(content=fix_prompt)]
+        }
+
+    def _finalize_fix(self, prepared: Dict, full_response: str) -> Dict:
+        """Save a finished fix to memory and build the response"""
+        session_id = prepared["session_id"]
+        language = prepared["language"]
         
         # Extract code block
         fixed_code = self._extract_code_block(full_response, language)
         
         # Save to memory
         chat_history = self.memory.get_session(session_id)
-        chat_history.add_user_message(f"Fix this {language} error: {error_message[:100]}")
+        chat_history.add_user_message(f"Fix this {language} error: {prepared['error_message'][:100]}")
         chat_history.add_ai_message(full_response[:200] + "...")
         
         # Update session
         self.sessions[session_id]["interaction_count"] += 1
+        self.sessions.save(session_id)
         
         return {
             "fixed_code": fixed_code,
             "full_explanation": full_response,
             "sources": [
                 {"filename": s["filename"], "content": s["document"][:200] + "..."}
-                for s in sources
+                for s in prepared["sources"]
             ],
             "session_id": session_id,
             "language": language
         }
 
+    def fix_code(
+        self,
+        code: str,
+        error_message: str,
+        language: str = "python",
+        session_id: Optional[str] = None
+    ) -> Dict:
+        """Fix code errors with context from documentation"""
+        with self.session_locks.hold(session_id):
+            prepared = self._prepare_fix(code, error_message, language, session_id)
+        
+            # Get fix
+            with self.llm_scheduler.slot("code_fix"):
+                response = self.llm.invoke(prepared["messages"])
+        
+            return self._finalize_fix(prepared, response.content)
+
+    def fix_code_stream(
+        self,
+        code: str,
+        error_message: str,
+        language: str = "python",
+        session_id: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """Streaming variant of fix_code(); same event shape as ask_stream()"""
+        with self.session_locks.hold(session_id):
+            prepared = self._prepare_fix(code, error_message, language, session_id)
+        
+            yield {
+                "type": "start",
+                "session_id": prepared["session_id"],
+                "sources": [
+                    {"filename": s["filename"], "content": s["document"][:200] + "..."}
+                    for s in prepared["sources"]
+                ]
+            }
+        
+            parts = []
+            with self.llm_scheduler.slot("code_fix"):
+                stream = self.llm.stream(prepared["messages"])
+                try:
+                    for chunk in stream:
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield {"type": "token", "content": chunk.content}
+                finally:
+                    stream.close()
+        
+            result = self._finalize_fix(prepared, "".join(parts))
+            result.pop("full_explanation")
+            yield {"type": "done", **result}
+
+    async def afix_code(
+        self,
+        code: str,
+        error_message: str,
+        language: str = "python",
+        session_id: Optional[str] = None
+    ) -> Dict:
+        """Async variant of fix_code()"""
+        async with self.session_locks.ahold(session_id):
+            prepared = await asyncio.to_thread(
+                self._prepare_fix, code, error_message, language, session_id
+            )
+        
+            async with self.llm_scheduler.aslot("code_fix"):
+                response = await self.llm.ainvoke(prepared["messages"])
+        
+            return self._finalize_fix(prepared, response.content)
+
+    async def afix_code_stream(
+        self,
+        code: str,
+        error_message: str,
+        language: str = "python",
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """Async variant of fix_code_stream()"""
+        async with self.session_locks.ahold(session_id):
+            prepared = await asyncio.to_thread(
+                self._prepare_fix, code, error_message, language, session_id
+            )
+        
+            yield {
+                "type": "start",
+                "session_id": prepared["session_id"],
+                "sources": [
+                    {"filename": s["filename"], "content": s["document"][:200] + "..."}
+                    for s in prepared["sources"]
+                ]
+            }
+        
+            parts = []
+            async with self.llm_scheduler.aslot("code_fix"):
+                stream = self.llm.astream(prepared["messages"])
+                try:
+                    async for chunk in stream:
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield {"type": "token", "content": chunk.content}
+                finally:
+                    await stream.aclose()
+        
+            result = self._finalize_fix(prepared, "".join(parts))
+            result.pop("full_explanation")
+            yield {"type": "done", **result}
+
     def _extract_code_block(self, text: str, language: str) -> str:
         """Extract code block from markdown"""
         pattern = rf"```{language}(.*?)```"
@@ -408,11 +1467,14 @@ Be specific and clear."""
         chat_history = self.memory.get_session(session_id)
         messages = chat_history.messages
         
+        state = self.memory.get_state(session_id)
+        
         return {
             "total_messages": len(messages),
             "user_messages": len([m for m in messages if isinstance(m, HumanMessage)]),
             "ai_messages": len([m for m in messages if isinstance(m, AIMessage)]),
-            "memory_type": "buffer"
+            "memory_type": self.sessions[session_id].get("memory_type", self.default_memory_type),
+            "summarized_messages": state.get("summarized_upto", 0)
         }
 
     def get_session_trace(self, session_id: str) -> Dict:
@@ -427,17 +1489,27 @@ Be specific and clear."""
             "created_at": session["created_at"],
             "total_interactions": session["interaction_count"],
             "user_id": session.get("user_id"),
-            "trace_log": session["trace_log"],
+            "trace_log": self.sessions.traces(session_id),
             "memory_summary": self._get_memory_summary(session_id)
         }
 
     def clear_session(self, session_id: str):
-        """Clear a conversation session"""
-        if session_id in self.sessions:
-            self.memory.clear_session(session_id)
-            self.sessions[session_id]["interaction_count"] = 0
-            self.sessions[session_id]["trace_log"] = []
-            logger.info(f"🗑️ Session {session_id} cleared")
+        """Clear a conversation session (waits for an in-flight turn to finish)"""
+        with self.session_locks.hold(session_id):
+            if session_id in self.sessions:
+                self.memory.clear_session(session_id)
+                self.sessions[session_id]["interaction_count"] = 0
+                self.sessions.save(session_id)
+                self.sessions.clear_traces(session_id)
+                logger.info(f"🗑️ Session {session_id} cleared")
+
+    def delete_session(self, session_id: str) -> bool:
+        """Remove a session and free its memory entirely"""
+        with self.session_locks.hold(session_id):
+            if self.sessions.pop(session_id) is None:
+                return False
+        logger.info(f"🗑️ Session {session_id} deleted")
+        return True
 
     def export_conversation(self, session_id: str, format: str = "json") -> str:
         """Export conversation in various formats"""
@@ -470,7 +1542,7 @@ Be specific and clear."""
                 "session_id": session_id,
                 "created_at": session["created_at"],
                 "interactions": history,
-                "trace": session["trace_log"]
+                "trace": self.sessions.traces(session_id)
             }, indent=2)
 
 
@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lower value = served first
+PRIORITIES = {
+    "interactive": 0,   # /query and its streams
+    "code_fix": 1,      # /fix-code
+    "background": 2,    # follow-up reformulation, memory summaries, batch jobs
+}
+
+
+class SchedulerSaturated(Exception):
+    """The LLM is saturated; status_code is what the API should answer with"""
+
+    status_code = 503
+    retry_after_seconds = 1
+
+
+class SchedulerQueueFull(SchedulerSaturated):
+    status_code = 429
+
+
+class SchedulerTimeout(SchedulerSaturated):
+    status_code = 503
+
+
+class _Waiter:
+    def __init__(self, priority: int, notify):
+        self.priority = priority
+        self.notify = notify
+        self.granted = False
+        self.abandoned = False
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the model server.
+
+    At most max_in_flight LLM calls run at once; further callers wait in a
+    priority queue (interactive before code fixes before background work,
+    FIFO within a class) of at most max_queue entries. A full queue fails
+    immediately with SchedulerQueueFull; waiting longer than
+    queue_timeout_seconds (or the per-call timeout) fails with
+    SchedulerTimeout. slot() serves threads and aslot() coroutines; both
+    draw on the same pool of slots.
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 64, queue_timeout_seconds: float = 30):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        self._lock = threading.Lock()
+        self._queue = []  # heap of (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._queued = {name: 0 for name in PRIORITIES}
+
+        self.admitted = {name: 0 for name in PRIORITIES}
+        self.rejected = {name: 0 for name in PRIORITIES}
+        self.timed_out = {name: 0 for name in PRIORITIES}
+        self._waits = {name: deque(maxlen=1000) for name in PRIORITIES}
+
+    @staticmethod
+    def _priority(name: str) -> int:
+        if name not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{name}'. Choose one of: {', '.join(PRIORITIES)}")
+        return PRIORITIES[name]
+
+    # -- admission -----------------------------------------------------------------
+
+    def _try_admit(self, name: str, notify) -> Optional[_Waiter]:
+        """Take a slot (returns None) or enqueue a waiter; raises when the queue is full"""
+        priority = self._priority(name)
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not any(self._queued.values()):
+                self._in_flight += 1
+                self._record_wait(name, 0.0)
+                return None
+            if sum(self._queued.values()) >= self.max_queue:
+                self.rejected[name] += 1
+                logger.warning(f"⛔ LLM queue full, rejecting {name} call")
+                raise SchedulerQueueFull(
+                    f"LLM queue is full ({self.max_queue} waiting); try again shortly"
+                )
+            waiter = _Waiter(priority, notify)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._queued[name] += 1
+            return waiter
+
+    def _abandon(self, name: str, waiter: _Waiter, timed_out: bool = True) -> bool:
+        """Give up waiting; returns True if a slot was granted meanwhile (caller must release)"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            self._queued[name] -= 1
+            if timed_out:
+                self.timed_out[name] += 1
+            return False
+
+    def release(self):
+        with self._lock:
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.abandoned:
+                    continue
+                # Hand the slot straight to the next waiter
+                waiter.granted = True
+                self._queued[self._name(waiter.priority)] -= 1
+                self._record_wait(
+                    self._name(waiter.priority), time.monotonic() - waiter.enqueued_at
+                )
+                waiter.notify()
+                return
+            self._in_flight -= 1
+
+    @staticmethod
+    def _name(priority: int) -> str:
+        return next(name for name, value in PRIORITIES.items() if value == priority)
+
+    def _record_wait(self, name: str, seconds: float):
+        self.admitted[name] += 1
+        self._waits[name].append(seconds)
+
+    def check_admission(self, name: str = "interactive"):
+        """Fail fast (before a stream starts) if a new call would be rejected right now"""
+        self._priority(name)
+        with self._lock:
+            busy = self._in_flight >= self.max_in_flight or any(self._queued.values())
+            if busy and sum(self._queued.values()) >= self.max_queue:
+                self.rejected[name] += 1
+                raise SchedulerQueueFull(
+                    f"LLM queue is full ({self.max_queue} waiting); try again shortly"
+                )
+
+    # -- sync / async slots -------------------------------------------------------
+
+    @contextmanager
+    def slot(self, name: str = "interactive", timeout: Optional[float] = None):
+        timeout = self.queue_timeout_seconds if timeout is None else timeout
+        event = threading.Event()
+        waiter = self._try_admit(name, event.set)
+        if waiter is not None and not event.wait(timeout):
+            if not self._abandon(name, waiter):
+                raise SchedulerTimeout(f"Waited more than {timeout}s for the LLM")
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, name: str = "interactive", timeout: Optional[float] = None):
+        timeout = self.queue_timeout_seconds if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        waiter = self._try_admit(name, notify)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                cancelled = isinstance(e, asyncio.CancelledError)
+                if self._abandon(name, waiter, timed_out=not cancelled):
+                    if cancelled:
+                        self.release()
+                        raise
+                    # Granted just as we timed out: use the slot
+                else:
+                    if cancelled:
+                        raise
+                    raise SchedulerTimeout(f"Waited more than {timeout}s for the LLM") from None
+        try:
+            yield
+        finally:
+            self.release()
+
+    # -- metrics ---------------------------------------------------------------------
+
+    def stats(self) -> Dict:
+        with self._lock:
+            in_flight = self._in_flight
+            queued = dict(self._queued)
+            waits = {name: sorted(values) for name, values in self._waits.items()}
+
+        def summary(values):
+            if not values:
+                return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+            return {
+                "avg": sum(values) / len(values),
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+                "max": values[-1]
+            }
+
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": in_flight,
+            "queue_depth": sum(queued.values()),
+            "queued": queued,
+            "admitted": dict(self.admitted),
+            "rejected_queue_full": dict(self.rejected),
+            "timed_out": dict(self.timed_out),
+            "wait_seconds": {name: summary(values) for name, values in waits.items()}
+        }
@@ -1,3 +1,6 @@
+import time
+_module_start = time.perf_counter()  # first, so the import-time report covers this module
+
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
@@ -5,12 +8,17 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-from langchain_agent import LangChainAgent
-from config.doc_loader import DocLoader
+from llm_scheduler import SchedulerSaturated
+from config.registry import format_timing, record_timing, startup_report, timed
+import asyncio
+import os
 import logging
 import json
 from datetime import datetime
 
+# LangChain, chromadb and sentence-transformers are imported lazily during
+# warmup (see _build_agent), so the process is up and answering probes fast
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -31,12 +39,18 @@ app.add_middleware(
 # Initialize agent
 agent = None
 
+# Background warmup progress: warming -> ready (or failed)
+warmup = {"status": "warming", "error": None, "started_at": None, "seconds": None}
+
 # ============================================================================
 # Pydantic Models
 # ============================================================================
 
 class SessionCreate(BaseModel):
     user_id: Optional[str] = Field(None, description="Optional user identifier")
+    memory_type: Optional[str] = Field(
+        None, description="Memory strategy: buffer, window (token budget) or summary (rolling summary)"
+    )
 
 class SessionResponse(BaseModel):
     session_id: str
@@ -48,6 +62,19 @@ class QueryRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="Session ID for conversation context")
     top_k: int = Field(default=5, ge=1, le=20, description="Number of documents to retrieve")
     filter_metadata: Optional[Dict] = Field(None, description="Metadata filters for retrieval")
+    section: Optional[str] = Field(
+        None, description="Only search this product area (tablerf, rapidfire_web, config)"
+    )
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=5000, description="Independent questions")
+    top_k: int = Field(default=5, ge=1, le=20, description="Number of documents to retrieve per question")
+    filter_metadata: Optional[Dict] = Field(None, description="Metadata filters for retrieval")
+    section: Optional[str] = Field(
+        None, description="Only search this product area (tablerf, rapidfire_web, config)"
+    )
+    max_concurrency: int = Field(default=4, ge=1, le=32, description="Concurrent LLM generations")
+    ordered: bool = Field(default=True, description="Stream results in input order (false: as completed)")
 
 class Source(BaseModel):
     rank: int
@@ -64,12 +91,25 @@ class TraceInfo(BaseModel):
     documents_retrieved: int
     processing_time_seconds: float
     interaction_number: int
+    answer_cache: Optional[str] = None
+    reformulation: Optional[Dict] = None
+    memory_type: Optional[str] = None
+    history_messages_in_prompt: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    prompt_tokens_estimated: Optional[int] = None
+    # Retrieval path: chroma / memmap, with "+bm25" when hybrid fusion ran
+    retrieval_mode: Optional[str] = None
+    # Rerank stage: status (reranked / over_budget / budget_exceeded / skipped), candidates, seconds
+    rerank: Optional[Dict] = None
+    # Prompt-context budgeting: tokens before/after, duplicates removed, sources trimmed
+    context: Optional[Dict] = None
 
 class MemorySummary(BaseModel):
     total_messages: int
     user_messages: int
     ai_messages: int
     memory_type: str
+    summarized_messages: int = 0
 
 class QueryResponse(BaseModel):
     answer: str
@@ -116,28 +156,112 @@ class HealthResponse(BaseModel):
     active_sessions: int
     tracing_enabled: bool
 
+def _saturated(e: SchedulerSaturated) -> HTTPException:
+    """429 when the LLM queue is full, 503 when waiting for a slot timed out"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after_seconds)}
+    )
+
+def _retrieval_filter(request) -> Optional[Dict]:
+    """filter_metadata, narrowed to request.section (searched as its own partition)"""
+    if not request.section:
+        return request.filter_metadata
+    conditions = [{"section": request.section}]
+    extra = request.filter_metadata or {}
+    if set(extra) == {"$and"}:
+        conditions.extend(extra["$and"])
+    else:
+        # Chroma wants one field per $and clause
+        conditions.extend({key: value} for key, value in extra.items())
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
 # ============================================================================
 # Startup
 # ============================================================================
 
-@app.on_event("startup")
-async def startup_event():
-    global agent
-    try:
-        logger.info("🚀 Initializing LangChain Agent...")
-        
-        agent = LangChainAgent(
+@app.on_event("shutdown")
+async def shutdown_event():
+    if agent is not None and agent.session_backend is not None:
+        # Commit any batched session writes before the worker exits
+        agent.session_backend.close()
+
+def _build_agent():
+    """Import the heavy stack, build the agent and warm the embedder (blocking)"""
+    with timed("import:langchain_agent"):
+        from langchain_agent import LangChainAgent
+        from session_backends import SQLiteSessionBackend
+    
+    with timed("agent_init"):
+        new_agent = LangChainAgent(
             collection_name="table_rf_docs",
             model_name="llama3:latest",
             enable_tracing=True,
-            # memory_type="buffer"
+            # Semantic answer cache (off by default: a near-duplicate question can get a
+            # stale or subtly wrong answer); ANSWER_CACHE=1 turns it on
+            enable_answer_cache=os.environ.get("ANSWER_CACHE", "0") == "1",
+            # Optional smaller model for rewriting follow-up questions
+            reformulation_model=os.environ.get("REFORMULATION_MODEL"),
+            memory_type=os.environ.get("AGENT_MEMORY_TYPE", "buffer"),
+            # Share sessions across uvicorn workers / restarts when a DB path is set
+            session_backend=(
+                SQLiteSessionBackend(os.environ["SESSION_DB_PATH"])
+                if os.environ.get("SESSION_DB_PATH") else None
+            ),
+            # Protect the Ollama server: concurrent calls and how many may wait
+            llm_max_in_flight=int(os.environ.get("LLM_MAX_IN_FLIGHT", "4")),
+            llm_max_queue=int(os.environ.get("LLM_MAX_QUEUE", "64")),
+            llm_queue_timeout=float(os.environ.get("LLM_QUEUE_TIMEOUT", "30")),
+            # chroma (default) or memmap: exact in-process search over an exported index
+            retrieval_engine=os.environ.get("RETRIEVAL_ENGINE", "chroma"),
+            # BM25 + vector fusion so exact property / tag names rank well
+            hybrid_search=os.environ.get("HYBRID_SEARCH", "1") == "1",
+            # Token budget for retrieved context in the prompt (0 disables trimming)
+            context_token_budget=int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500")),
+            # Cross-encoder rerank (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2); unset disables
+            reranker_model=os.environ.get("RERANKER_MODEL"),
+            rerank_candidates=int(os.environ.get("RERANK_CANDIDATES", "20")),
+            rerank_budget_seconds=float(os.environ.get("RERANK_BUDGET_SECONDS", "0.3"))
         )
-        
+    
+    # The first encode pays for kernel/tokenizer setup; do it before real traffic
+    with timed("embedder_warmup"):
+        new_agent.embeddings.base.embed_documents(["warmup"])
+    if new_agent.reranker is not None:
+        with timed("reranker_warmup"):
+            new_agent.reranker.warm_up()
+    
+    return new_agent
+
+async def _warm_up():
+    global agent
+    warmup["started_at"] = datetime.now().isoformat()
+    start = time.perf_counter()
+    try:
+        logger.info("🚀 Initializing LangChain Agent...")
+        agent = await asyncio.to_thread(_build_agent)
+        warmup["status"] = "ready"
         logger.info("✅ LangChain Agent initialized successfully")
-        
+        for name, timing in startup_report()["timings"].items():
+            logger.info(f"⏱️ {name}: {format_timing(timing)}")
     except Exception as e:
+        warmup["status"] = "failed"
+        warmup["error"] = str(e)
         logger.error(f"❌ Failed to initialize: {e}")
-        raise
+    finally:
+        warmup["seconds"] = time.perf_counter() - start
+
+@app.on_event("startup")
+async def startup_event():
+    # STARTUP_MODE=background (default) serves probes while models load;
+    # STARTUP_MODE=eager blocks startup until the agent is ready
+    if os.environ.get("STARTUP_MODE", "background") == "eager":
+        await _warm_up()
+        if warmup["status"] == "failed":
+            raise RuntimeError(warmup["error"])
+    else:
+        app.state.warmup_task = asyncio.create_task(_warm_up())
 
 # ============================================================================
 # Health & Info Endpoints
@@ -145,21 +269,44 @@ async def startup_event():
 
 @app.get("/", response_model=HealthResponse)
 async def health_check():
-    """Check system health and status"""
+    """Check system health and status (`warming` while models load in the background)"""
     if agent is None:
-        raise HTTPException(status_code=503, detail="Agent not initialized")
+        if warmup["status"] == "warming":
+            return HealthResponse(
+                status="warming",
+                agent_status="warming",
+                documents_count=0,
+                active_sessions=0,
+                tracing_enabled=False
+            )
+        raise HTTPException(status_code=503, detail=f"Agent not initialized: {warmup['error']}")
     
     try:
+        documents_count = await asyncio.to_thread(agent.vectorstore._collection.count)
+        
         return HealthResponse(
             status="healthy",
             agent_status="ready",
-            documents_count=agent.vectorstore._collection.count(),
+            documents_count=documents_count,
             active_sessions=len(agent.sessions),
             tracing_enabled=agent.enable_tracing
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and serving HTTP (says nothing about models)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 200 once the agent can answer queries, 503 while warming or failed"""
+    body = {**warmup, "startup": startup_report()}
+    if warmup["status"] != "ready":
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
 @app.get("/stats")
 async def get_stats():
     """Get comprehensive system statistics"""
@@ -172,13 +319,22 @@ async def get_stats():
             for session in agent.sessions.values()
         )
         
+        total_documents = await asyncio.to_thread(agent.vectorstore._collection.count)
+        
         return {
-            "total_documents": agent.vectorstore._collection.count(),
+            "total_documents": total_documents,
             "active_sessions": len(agent.sessions),
             "total_interactions": total_interactions,
             "embedding_model": "all-MiniLM-L6-v2",
             "llm_model": agent.model_name,
-            "tracing_enabled": agent.enable_tracing
+            "tracing_enabled": agent.enable_tracing,
+            "query_embedding_cache": agent.query_cache.stats(),
+            "answer_cache": agent.answer_cache.stats() if agent.answer_cache else None,
+            "session_store": agent.sessions.stats(),
+            "session_backend": agent.session_backend.stats() if agent.session_backend else None,
+            "llm_scheduler": agent.llm_scheduler.stats(),
+            "reranker": agent.reranker.stats() if agent.reranker else None,
+            "startup": startup_report()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
@@ -194,7 +350,10 @@ async def create_session(request: SessionCreate):
         raise HTTPException(status_code=503, detail="Agent not initialized")
     
     try:
-        session_id = agent.create_session(user_id=request.user_id)
+        session_id = agent.create_session(
+            user_id=request.user_id,
+            memory_type=request.memory_type
+        )
         session = agent.sessions[session_id]
         
         return SessionResponse(
@@ -202,6 +361,8 @@ async def create_session(request: SessionCreate):
             created_at=session["created_at"],
             message="Session created successfully with conversation memory"
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to create session: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create session: {str(e)}")
@@ -237,14 +398,22 @@ async def get_session_trace(session_id: str):
     return SessionTrace(**trace)
 
 @app.delete("/session/{session_id}")
-async def clear_session(session_id: str):
-    """Clear conversation history for a session"""
+async def clear_session(session_id: str, purge: bool = False):
+    """Clear conversation history for a session (purge=true removes the session entirely)"""
     if agent is None:
         raise HTTPException(status_code=503, detail="Agent not initialized")
     
     try:
-        agent.clear_session(session_id)
+        # Off the event loop: these wait for an in-flight turn on the same session
+        if purge:
+            if not await asyncio.to_thread(agent.delete_session, session_id):
+                raise HTTPException(status_code=404, detail="Session not found")
+            return {"message": f"Session {session_id} deleted successfully"}
+        
+        await asyncio.to_thread(agent.clear_session, session_id)
         return {"message": f"Session {session_id} cleared successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to clear session: {str(e)}")
 
@@ -284,6 +453,8 @@ async def query_with_context(request: QueryRequest):
     - **session_id**: Optional session ID (creates new if not provided)
     - **top_k**: Number of relevant documents to retrieve
     - **filter_metadata**: Optional metadata filters for document retrieval
+      (section, doc_type, path, heading_path, doc_size, ...)
+    - **section**: Optional product area to search (tablerf, rapidfire_web, config)
     """
     if agent is None:
         raise HTTPException(status_code=503, detail="Agent not initialized")
@@ -292,19 +463,110 @@ async def query_with_context(request: QueryRequest):
         logger.info(f"📥 Received query: {request.query[:100]}...")
         
         # Get answer with full context
-        result = agent.ask(
+        result = await agent.aask(
             query=request.query,
             session_id=request.session_id,
             top_k=request.top_k,
-            filter_metadata=request.filter_metadata
+            filter_metadata=_retrieval_filter(request)
         )
         
         return QueryResponse(**result)
     
+    except SchedulerSaturated as e:
+        raise _saturated(e)
     except Exception as e:
         logger.error(f"Query failed: {e}")
         raise HTTPException(status_code=500, detail=f"Query processing failed: {str(e)}")
 
+async def _ndjson_stream(events):
+    """
+    Serialize agent stream events as newline-delimited JSON. When the client
+    disconnects the response task is cancelled; closing `events` then runs
+    the agent's cleanup (Ollama request, LLM slot, session lock) right away
+    instead of whenever the generator is garbage collected.
+    """
+    try:
+        async for event in events:
+            yield json.dumps(event, default=str) + "\n"
+    except Exception as e:
+        logger.error(f"Stream failed: {e}")
+        status = e.status_code if isinstance(e, SchedulerSaturated) else 500
+        yield json.dumps({"type": "error", "status": status, "detail": str(e)}) + "\n"
+    finally:
+        await events.aclose()
+
+@app.post("/query/stream")
+async def query_with_context_stream(request: QueryRequest):
+    """
+    Streaming variant of /query (NDJSON, one event per line)
+    
+    Events: `start` (session, reformulated question, sources), `token`
+    (answer text as it is generated), `done` (trace and memory summary),
+    or `error`.
+    """
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Agent not initialized")
+    
+    logger.info(f"📥 Received streaming query: {request.query[:100]}...")
+    
+    # Reject before the 200 goes out if the LLM queue is already full
+    try:
+        agent.llm_scheduler.check_admission("interactive")
+    except SchedulerSaturated as e:
+        raise _saturated(e)
+    
+    events = agent.aask_stream(
+        query=request.query,
+        session_id=request.session_id,
+        top_k=request.top_k,
+        filter_metadata=_retrieval_filter(request)
+    )
+    return StreamingResponse(_ndjson_stream(events), media_type="application/x-ndjson")
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest):
+    """
+    Answer many independent questions (evaluation / pre-warm jobs), NDJSON
+    
+    All questions are embedded in one encoder call and retrieved with one
+    multi-query Chroma lookup; LLM generations run with bounded concurrency.
+    Events: one `result` (or per-question `error`) line per question with its
+    `index`, then `done`.
+    """
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Agent not initialized")
+    
+    logger.info(f"📥 Received batch of {len(request.queries)} queries")
+    
+    async def events():
+        start = datetime.now()
+        errors = 0
+        results = agent.aask_batch(
+            queries=request.queries,
+            top_k=request.top_k,
+            filter_metadata=_retrieval_filter(request),
+            max_concurrency=request.max_concurrency,
+            ordered=request.ordered
+        )
+        try:
+            async for item in results:
+                if "error" in item:
+                    errors += 1
+                    yield {"type": "error", **item}
+                else:
+                    yield {"type": "result", **item}
+        finally:
+            # Cancels the generations still running for a client that went away
+            await results.aclose()
+        yield {
+            "type": "done",
+            "count": len(request.queries),
+            "errors": errors,
+            "elapsed_seconds": (datetime.now() - start).total_seconds()
+        }
+    
+    return StreamingResponse(_ndjson_stream(events()), media_type="application/x-ndjson")
+
 # ============================================================================
 # Code Fixing Endpoints
 # ============================================================================
@@ -325,7 +587,7 @@ async def fix_code_error(request: CodeFixRequest):
     try:
         logger.info(f"🔧 Fixing {request.language} code error...")
         
-        result = agent.fix_code(
+        result = await agent.afix_code(
             code=request.code,
             error_message=request.error_message,
             language=request.language,
@@ -334,22 +596,52 @@ async def fix_code_error(request: CodeFixRequest):
         
         return CodeFixResponse(**result)
     
+    except SchedulerSaturated as e:
+        raise _saturated(e)
     except Exception as e:
         logger.error(f"Code fixing failed: {e}")
         raise HTTPException(status_code=500, detail=f"Code fixing failed: {str(e)}")
 
+@app.post("/fix-code/stream")
+async def fix_code_error_stream(request: CodeFixRequest):
+    """Streaming variant of /fix-code (NDJSON: `start`, `token`..., `done`)"""
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Agent not initialized")
+    
+    logger.info(f"🔧 Streaming fix for {request.language} code error...")
+    
+    try:
+        agent.llm_scheduler.check_admission("code_fix")
+    except SchedulerSaturated as e:
+        raise _saturated(e)
+    
+    events = agent.afix_code_stream(
+        code=request.code,
+        error_message=request.error_message,
+        language=request.language,
+        session_id=request.session_id
+    )
+    return StreamingResponse(_ndjson_stream(events), media_type="application/x-ndjson")
+
 # ============================================================================
 # Document Management
 # ============================================================================
 
 @app.post("/load-docs")
-async def load_documents(docs_dir: str = "./docs/tablerf"):
-    """Load documents from directory into the knowledge base"""
+async def load_documents(docs_dir: str = "./docs/tablerf", incremental: bool = True):
+    """Load documents from directory into the knowledge base (incremental sync by default)"""
     try:
         logger.info(f"📚 Loading documents from: {docs_dir}")
         
-        loader = DocLoader(docs_dir=docs_dir)
-        count = loader.load_docs()
+        from config.doc_loader import DocLoader
+        
+        # Model loading and ingest are blocking: keep them off the event loop
+        loader = await asyncio.to_thread(DocLoader, docs_dir=docs_dir)
+        count = await asyncio.to_thread(loader.load_docs, incremental=incremental)
+        
+        # Cached answers may cite docs that just changed
+        if agent is not None and agent.answer_cache is not None and loader.collection_changed:
+            agent.answer_cache.invalidate()
         
         return {
             "success": True,
@@ -389,7 +681,8 @@ async def list_sessions():
             "created_at": session["created_at"],
             "interaction_count": session["interaction_count"],
             "user_id": session.get("user_id"),
-            "memory_messages": len(session["memory"].chat_memory.messages)
+            "memory_type": session.get("memory_type"),
+            "memory_messages": len(agent.get_conversation_history(session_id) or [])
         })
     
     return {
@@ -397,6 +690,9 @@ async def list_sessions():
         "sessions": sessions_info
     }
 
+# Import-time profile entry; `python profile_imports.py` breaks it down per module
+record_timing("import:main", time.perf_counter() - _module_start)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
@@ -1,13 +1,19 @@
+import time
+_module_start = time.perf_counter()  # first, so the import-time report covers this module
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
-from typing import List
-from rag import FileWiseRAG
-from config.doc_loader import DocLoader
+from typing import Dict, List, Optional
+from config.registry import format_timing, record_timing, startup_report, timed
+import asyncio
+import os
 import logging
+import uuid
 from contextlib import asynccontextmanager
+from datetime import datetime
 
 
 # Configure logging
@@ -15,25 +21,71 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 rag_system = None  # global
+# rag / doc_loader (sentence-transformers, chromadb, ollama) load during warmup
+warmup = {"status": "warming", "error": None, "started_at": None, "seconds": None}
+
+# Reindex jobs by id (insertion ordered); at most one runs at a time and only the
+# most recent MAX_REINDEX_JOBS are kept for polling
+MAX_REINDEX_JOBS = 100
+reindex_jobs: Dict[str, Dict] = {}
+reindex_task = None
+
+def _build_rag():
+    """Import the heavy stack, build the RAG system and warm the embedder (blocking)"""
+    with timed("import:rag"):
+        from rag import FileWiseRAG
+
+    with timed("rag_init"):
+        rag = FileWiseRAG(
+            collection_name="table_rf_docs",
+            model_name="llama3:latest",
+            # Semantic answer cache (off by default: a near-duplicate question can get a
+            # stale or subtly wrong answer); ANSWER_CACHE=1 turns it on
+            enable_answer_cache=os.environ.get("ANSWER_CACHE", "0") == "1",
+            # RETRIEVAL_ENGINE=memmap answers queries from the in-process exact index
+            use_vector_index=os.environ.get("RETRIEVAL_ENGINE", "chroma") == "memmap"
+        )
 
-# Lifespan handler
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+    # The first encode pays for kernel/tokenizer setup; do it before real traffic
+    with timed("embedder_warmup"):
+        rag.embedder.encode(["warmup"])
+    return rag
+
+async def _warm_up():
     global rag_system
+    warmup["started_at"] = datetime.now().isoformat()
+    start = time.perf_counter()
     try:
         logger.info("Initializing RAG system on startup...")
-        rag_system = FileWiseRAG(
-            collection_name="table_rf_docs",
-            model_name="llama3:latest"
-        )
+        rag_system = await asyncio.to_thread(_build_rag)
+        warmup["status"] = "ready"
         logger.info("RAG system initialized successfully")
+        for name, timing in startup_report()["timings"].items():
+            logger.info(f"{name}: {format_timing(timing)}")
     except Exception as e:
+        warmup["status"] = "failed"
+        warmup["error"] = str(e)
         logger.error(f"Failed to initialize RAG system: {e}")
-        raise
+    finally:
+        warmup["seconds"] = time.perf_counter() - start
+
+# Lifespan handler
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # STARTUP_MODE=background (default) serves probes while models load;
+    # STARTUP_MODE=eager blocks startup until the RAG system is ready
+    if os.environ.get("STARTUP_MODE", "background") == "eager":
+        await _warm_up()
+        if warmup["status"] == "failed":
+            raise RuntimeError(warmup["error"])
+    else:
+        app.state.warmup_task = asyncio.create_task(_warm_up())
 
     yield  # app runs here
 
     logger.info("Shutting down application...")
+    if rag_system is not None:
+        rag_system.embedding_cache.flush()
 
 # FastAPI initialization with lifespan
 app = FastAPI(
@@ -76,18 +128,39 @@ class HealthResponse(BaseModel):
 
 class LoadDocsRequest(BaseModel):
     docs_dir: str = Field(default="./docs")
-
-class LoadDocsResponse(BaseModel):
-    success: bool
-    documents_loaded: int
-    message: str
+    incremental: bool = Field(
+        default=True,
+        description="Update the live index in place (new/changed files only); "
+                    "false rebuilds into a shadow collection and swaps it in"
+    )
+
+class ReindexJob(BaseModel):
+    job_id: str
+    status: str  # queued, running, succeeded, failed
+    docs_dir: str
+    incremental: bool
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    documents_loaded: Optional[int] = None
+    collection: Optional[str] = None
+    previous_collection: Optional[str] = None
+    stats: Optional[Dict] = None
+    error: Optional[str] = None
 
 
 # Health check
 @app.get("/", response_model=HealthResponse)
 async def health_check():
     if rag_system is None:
-        raise HTTPException(status_code=503, detail="RAG not initialized")
+        if warmup["status"] == "warming":
+            return HealthResponse(
+                status="warming",
+                collection_name="table_rf_docs",
+                document_count=0,
+                model_name="llama3:latest"
+            )
+        raise HTTPException(status_code=503, detail=f"RAG not initialized: {warmup['error']}")
 
     try:
         doc_count = rag_system.collection.get_count()
@@ -100,6 +173,19 @@ async def health_check():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Health failed: {e}")
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and serving HTTP"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 200 once queries can be answered, 503 while warming or failed"""
+    body = {**warmup, "startup": startup_report()}
+    if warmup["status"] != "ready":
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
 # Query endpoint
 @app.post("/query", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
@@ -109,7 +195,10 @@ async def query_documents(request: QueryRequest):
     try:
         logger.info(f"🔍 Processing query: {request.query}")
 
-        answer, sources = rag_system.ask(request.query, top_k=request.top_k)
+        # Embedding, Chroma and Ollama calls block: run them off the event loop
+        answer, sources = await asyncio.to_thread(
+            rag_system.ask, request.query, top_k=request.top_k
+        )
 
         formatted_sources = [
             Source(
@@ -132,28 +221,79 @@ async def query_documents(request: QueryRequest):
 
 
 # Load docs
-@app.post("/load-docs", response_model=LoadDocsResponse)
-async def load_documents(request: LoadDocsRequest):
+def _run_reindex(job: Dict):
+    """Blocking part of a reindex job (runs on a worker thread)"""
+    from config.doc_loader import DocLoader, rebuild_with_swap
+
+    if job["incremental"]:
+        # Upserts changed files and then drops stale rows: the live index never empties
+        loader = DocLoader(docs_dir=job["docs_dir"], collection_name="table_rf_docs")
+        job["documents_loaded"] = loader.load_docs(incremental=True)
+        job["collection"] = loader.collection.name
+        job["stats"] = loader.last_stats
+        return loader.collection_changed
+
+    result = rebuild_with_swap(alias="table_rf_docs", docs_dir=job["docs_dir"])
+    job["documents_loaded"] = result["documents_loaded"]
+    job["collection"] = result["collection"]
+    job["previous_collection"] = result["previous_collection"]
+    job["stats"] = result["stats"]
+    return True
+
+
+async def _reindex_worker(job: Dict):
+    job["status"] = "running"
+    job["started_at"] = datetime.now().isoformat()
     try:
-        logger.info(f"📂 Loading docs from: {request.docs_dir}")
+        changed = await asyncio.to_thread(_run_reindex, job)
+        if rag_system is not None and changed:
+            # Swap the serving collection in place; embedder and caches stay loaded
+            await asyncio.to_thread(rag_system.reload_collection)
+        job["status"] = "succeeded"
+        logger.info(f"✅ Reindex {job['job_id']} finished: {job['documents_loaded']} documents")
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        logger.error(f"❌ Reindex {job['job_id']} failed: {e}")
+    finally:
+        job["finished_at"] = datetime.now().isoformat()
 
-        loader = DocLoader(docs_dir=request.docs_dir)
-        count = loader.load_docs()
 
-        global rag_system
-        rag_system = FileWiseRAG(
-            collection_name="table_rf_docs",
-            model_name="llama3:latest"
+@app.post("/load-docs", response_model=ReindexJob, status_code=202)
+async def load_documents(request: LoadDocsRequest):
+    """
+    Start a background reindex and return its job; poll GET /load-docs/{job_id}.
+    Queries keep being served from the current index until the new one is ready.
+    """
+    global reindex_task
+    if reindex_task is not None and not reindex_task.done():
+        raise HTTPException(
+            status_code=409, detail=f"Reindex {reindex_task.get_name()} is already running"
         )
 
-        return LoadDocsResponse(
-            success=True,
-            documents_loaded=count,
-            message=f"Loaded {count} documents"
-        )
-    except Exception as e:
-        logger.error(f"❌ Load failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"📂 Reindexing docs from: {request.docs_dir}")
+
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "docs_dir": request.docs_dir,
+        "incremental": request.incremental,
+        "created_at": datetime.now().isoformat()
+    }
+    reindex_jobs[job["job_id"]] = job
+    # Only one job runs at a time, so everything but the newest is finished
+    while len(reindex_jobs) > MAX_REINDEX_JOBS:
+        reindex_jobs.pop(next(iter(reindex_jobs)))
+    reindex_task = asyncio.create_task(_reindex_worker(job), name=job["job_id"])
+    return ReindexJob(**job)
+
+
+@app.get("/load-docs/{job_id}", response_model=ReindexJob)
+async def get_reindex_job(job_id: str):
+    job = reindex_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return ReindexJob(**job)
 
 
 # Stats endpoint
@@ -167,8 +307,12 @@ async def get_stats():
         return {
             "total_documents": doc_count,
             "collection_name": "table_rf_docs",
+            "active_collection": rag_system.collection.name,
             "embedding_model": "all-MiniLM-L6-v2",
-            "llm_model": rag_system.model_name
+            "llm_model": rag_system.model_name,
+            "query_embedding_cache": rag_system.query_cache.stats(),
+            "answer_cache": rag_system.answer_cache.stats() if rag_system.answer_cache else None,
+            "startup": startup_report()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -182,6 +326,10 @@ async def serve_frontend():
     return FileResponse("static/index.html")
 
 
+# Import-time profile entry; `python profile_imports.py` breaks it down per module
+record_timing("import:main2", time.perf_counter() - _module_start)
+
+
 # Uvicorn entry
 if __name__ == "__main__":
     import uvicorn
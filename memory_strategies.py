@@ -0,0 +1,126 @@
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for llama-family tokenizers)"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    # +4 per message for role/formatting overhead in the chat template
+    return sum(estimate_tokens(str(m.content)) + 4 for m in messages)
+
+
+def _tail_within_budget(messages: List[BaseMessage], max_tokens: int) -> List[BaseMessage]:
+    """Most recent messages that fit in max_tokens, starting on a user turn"""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        cost = count_message_tokens([message])
+        if used + cost > max_tokens:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+
+    # Never open the window with an orphaned assistant reply
+    while kept and not isinstance(kept[0], HumanMessage):
+        kept.pop(0)
+    return kept
+
+
+class BufferMemory:
+    """Whole conversation goes into every prompt (original behaviour)"""
+
+    name = "buffer"
+
+    def __init__(self, max_tokens: int = 0):
+        self.max_tokens = max_tokens
+
+    def select(self, messages: List[BaseMessage], state: Dict) -> List[BaseMessage]:
+        return list(messages)
+
+    def needs_compression(self, messages: List[BaseMessage], state: Dict) -> bool:
+        return False
+
+
+class TokenWindowMemory(BufferMemory):
+    """Sliding window: only the most recent turns that fit in max_tokens"""
+
+    name = "window"
+
+    def __init__(self, max_tokens: int = 1500):
+        self.max_tokens = max_tokens
+
+    def select(self, messages: List[BaseMessage], state: Dict) -> List[BaseMessage]:
+        return _tail_within_budget(messages, self.max_tokens)
+
+
+class SummaryMemory(BufferMemory):
+    """
+    Rolling summary: turns older than the window are compressed into a
+    summary (in the background) and sent as one system message, followed by
+    the recent turns that fit in max_tokens.
+    """
+
+    name = "summary"
+
+    def __init__(self, max_tokens: int = 1500):
+        self.max_tokens = max_tokens
+
+    def select(self, messages: List[BaseMessage], state: Dict) -> List[BaseMessage]:
+        summarized_upto = state.get("summarized_upto", 0)
+        recent = _tail_within_budget(messages[summarized_upto:], self.max_tokens)
+
+        selected = []
+        if state.get("summary"):
+            selected.append(SystemMessage(
+                content=f"Summary of the earlier conversation:\n{state['summary']}"
+            ))
+        return selected + recent
+
+    def needs_compression(self, messages: List[BaseMessage], state: Dict) -> bool:
+        pending = messages[state.get("summarized_upto", 0):]
+        return count_message_tokens(pending) > self.max_tokens
+
+    def split_for_compression(self, messages: List[BaseMessage], state: Dict) -> Optional[int]:
+        """Index up to which messages should be folded into the summary"""
+        summarized_upto = state.get("summarized_upto", 0)
+        pending = messages[summarized_upto:]
+        recent = _tail_within_budget(pending, self.max_tokens // 2)
+        cut = len(messages) - len(recent)
+        return cut if cut > summarized_upto else None
+
+    @staticmethod
+    def summary_prompt(previous_summary: str, messages: List[BaseMessage]) -> str:
+        transcript = "\n".join(
+            f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+            for m in messages
+        )
+        return f"""Update the running summary of a conversation between a user and a documentation assistant.
+Keep facts, names, component/property identifiers and open questions. Be concise.
+
+Current summary:
+{previous_summary or "(none)"}
+
+New conversation turns:
+{transcript}
+
+Updated summary:"""
+
+
+MEMORY_STRATEGIES = {
+    BufferMemory.name: BufferMemory,
+    TokenWindowMemory.name: TokenWindowMemory,
+    SummaryMemory.name: SummaryMemory,
+}
+
+
+def get_memory_strategy(memory_type: str, max_tokens: int = 1500):
+    if memory_type not in MEMORY_STRATEGIES:
+        raise ValueError(
+            f"Unknown memory type '{memory_type}'. Choose one of: {', '.join(MEMORY_STRATEGIES)}"
+        )
+    return MEMORY_STRATEGIES[memory_type](max_tokens=max_tokens)
@@ -0,0 +1,77 @@
+"""
+Import-time profile of the API entry points.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+reports the slowest imports plus any heavy package that got pulled in at
+import time (it should only load during warmup). Exits non-zero when the
+total exceeds --max-seconds or a heavy package is imported, so CI can catch
+cold-start regressions:
+
+    python profile_imports.py main main2 --max-seconds 1.5
+"""
+import argparse
+import subprocess
+import sys
+
+# Packages that must only be imported lazily (during warmup / first use)
+HEAVY_PACKAGES = (
+    "langchain", "langchain_core", "langchain_community", "langchain_ollama",
+    "chromadb", "sentence_transformers", "transformers", "torch", "ollama"
+)
+
+
+def profile(module: str):
+    """Return [(cumulative_us, self_us, name)] for every import made by `import module`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def report(module: str, top: int):
+    rows = profile(module)
+    # The module itself is the last, outermost entry
+    total_us = next((c for c, _, name in reversed(rows) if name.strip() == module), 0)
+    imported = {name.strip() for _, _, name in rows}
+    heavy = sorted(
+        name for name in imported if name.split(".")[0] in HEAVY_PACKAGES and "." not in name
+    )
+
+    print(f"\n{'='*60}")
+    print(f"import {module}: {total_us / 1e6:.3f}s, {len(rows)} modules")
+    print(f"{'='*60}")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1e3:>10.1f}ms {self_us / 1e3:>8.1f}ms  {name}")
+    if heavy:
+        print(f"⚠️ Heavy packages imported eagerly: {', '.join(heavy)}")
+    return total_us / 1e6, heavy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=["main", "main2"])
+    parser.add_argument("--top", type=int, default=25, help="How many of the slowest imports to list")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail above this import time")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        seconds, heavy = report(module, args.top)
+        if heavy:
+            failed = True
+        if args.max_seconds is not None and seconds > args.max_seconds:
+            print(f"❌ import {module} took {seconds:.3f}s (limit {args.max_seconds}s)")
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from memory_strategies import estimate_tokens
+
+# Joins the passages kept from one source, marking where text was cut
+PASSAGE_SEPARATOR = "\n...\n"
+
+
+def split_passages(text: str, max_tokens: int) -> List[str]:
+    """
+    Split a document into passages: blank-line separated blocks (fenced code
+    blocks are never split on their blank lines), with blocks longer than
+    max_tokens broken up on line boundaries.
+    """
+    blocks, current, in_code = [], [], False
+    for line in text.split("\n"):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        if not line.strip() and not in_code:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+
+    passages = []
+    for block in blocks:
+        if estimate_tokens(block) <= max_tokens:
+            passages.append(block)
+            continue
+        piece = []
+        for line in block.split("\n"):
+            if piece and estimate_tokens("\n".join(piece + [line])) > max_tokens:
+                passages.append("\n".join(piece))
+                piece = []
+            piece.append(line)
+        if piece:
+            passages.append("\n".join(piece))
+    return passages
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class PromptBuilder:
+    """
+    Fits retrieved sources into a context token budget before they go into
+    the prompt.
+
+    1. Near-duplicate sources (cosine similarity of their embeddings at or
+       above dedup_threshold) are dropped, keeping the better-ranked one.
+    2. A source longer than max_source_tokens is cut down to its passages
+       most similar to the query, kept in document order.
+    3. Sources are added best first until max_context_tokens is spent; the
+       last one is trimmed to whatever budget remains, and sources that
+       would get less than min_source_tokens are left out.
+
+    embed_fn(list_of_texts) -> vectors embeds whole chunks; passing the
+    persistent embedding-cache backed encoder reuses the vectors ingest
+    already computed. Passages are query-time text nobody ingests, so they
+    go to passage_fn (the bare encoder) through a small in-memory LRU of
+    passage_cache_size vectors instead of the persistent cache.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Sequence],
+        passage_fn: Callable[[List[str]], Sequence],
+        max_context_tokens: int = 1500,
+        max_source_tokens: int = 300,
+        passage_tokens: int = 80,
+        min_source_tokens: int = 40,
+        dedup_threshold: float = 0.95,
+        passage_cache_size: int = 4096
+    ):
+        self.embed_fn = embed_fn
+        self.passage_fn = passage_fn
+        self.passage_cache_size = passage_cache_size
+        self._passage_vectors = OrderedDict()  # passage text -> vector
+        self._passage_lock = threading.Lock()
+        self.max_context_tokens = max_context_tokens
+        self.max_source_tokens = max_source_tokens
+        self.passage_tokens = passage_tokens
+        self.min_source_tokens = min_source_tokens
+        self.dedup_threshold = dedup_threshold
+
+    def _deduplicate(self, sources: List[Dict]) -> Tuple[List[Dict], int]:
+        if len(sources) < 2:
+            return list(sources), 0
+        vectors = _unit_rows(self.embed_fn([s["document"] for s in sources]))
+        kept, kept_vectors = [], []
+        for source, vector in zip(sources, vectors):
+            if kept_vectors and float(np.max(np.stack(kept_vectors) @ vector)) >= self.dedup_threshold:
+                continue
+            kept.append(source)
+            kept_vectors.append(vector)
+        return kept, len(sources) - len(kept)
+
+    def _embed_passages(self, passages: List[str]) -> np.ndarray:
+        with self._passage_lock:
+            vectors = [self._passage_vectors.get(p) for p in passages]
+            for p, vector in zip(passages, vectors):
+                if vector is not None:
+                    self._passage_vectors.move_to_end(p)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            fresh = np.asarray(self.passage_fn([passages[i] for i in missing]), dtype=np.float32)
+            with self._passage_lock:
+                for i, vector in zip(missing, fresh):
+                    vectors[i] = self._passage_vectors[passages[i]] = vector
+                while len(self._passage_vectors) > self.passage_cache_size:
+                    self._passage_vectors.popitem(last=False)
+        return np.vstack(vectors)
+
+    def _trim(self, text: str, query_vector: np.ndarray, budget: int) -> Tuple[str, bool]:
+        """The passages of text most relevant to the query that fit in budget tokens"""
+        if estimate_tokens(text) <= budget:
+            return text, False
+
+        passages = split_passages(text, min(self.passage_tokens, budget))
+        scores = _unit_rows(self._embed_passages(passages)) @ query_vector
+
+        chosen, used = [], 0
+        separator_tokens = estimate_tokens(PASSAGE_SEPARATOR)
+        for i in np.argsort(-scores):
+            cost = estimate_tokens(passages[i]) + separator_tokens
+            if used + cost <= budget:
+                chosen.append(int(i))
+                used += cost
+        if not chosen:
+            # A single overlong line: keep the head of the best passage
+            return passages[int(np.argmax(scores))][:budget * 4], True
+        return PASSAGE_SEPARATOR.join(passages[i] for i in sorted(chosen)), True
+
+    def build(self, query_embedding, sources: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """
+        Return (sources to put in the prompt, stats). Kept sources are
+        copies with a possibly shortened "document" and a "truncated" flag;
+        ranks are renumbered so citations stay consecutive.
+        """
+        start = time.perf_counter()
+        tokens_before = sum(estimate_tokens(s["document"]) for s in sources)
+
+        unique, duplicates = self._deduplicate(sources)
+        query_vector = _unit_rows(query_embedding)[0]
+
+        kept, used, truncated, dropped = [], 0, 0, 0
+        for source in unique:
+            remaining = min(self.max_context_tokens - used, self.max_source_tokens)
+            if remaining < self.min_source_tokens:
+                dropped += 1
+                continue
+            document, was_truncated = self._trim(source["document"], query_vector, remaining)
+            truncated += was_truncated
+            used += estimate_tokens(document)
+            kept.append(dict(source, document=document, truncated=was_truncated))
+
+        for i, source in enumerate(kept):
+            if "rank" in source:
+                source["rank"] = i + 1
+                source["relevance_note"] = f"Source {i+1}"
+
+        stats = {
+            "context_tokens_before": tokens_before,
+            "context_tokens_after": used,
+            "tokens_saved": tokens_before - used,
+            "sources_retrieved": len(sources),
+            "sources_used": len(kept),
+            "duplicates_removed": duplicates,
+            "sources_truncated": truncated,
+            "sources_dropped_for_budget": dropped,
+            "seconds": time.perf_counter() - start
+        }
+        return kept, stats
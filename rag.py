@@ -1,20 +1,69 @@
-from sentence_transformers import SentenceTransformer
 from config.collection_manager import CollectionManager
+from config.embedding_cache import get_embedding_cache
+from config.query_cache import QueryEmbeddingCache
+from config.answer_cache import SemanticAnswerCache, doc_signature
+from config.embedding_backend import cache_namespace
+from config.registry import get_embedder
+from prompt_builder import PromptBuilder
 import ollama
 
 class FileWiseRAG:
-    def __init__(self, collection_name="table_rf_docs", model_name="llama3:latest"):
-        self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
-        self.collection = CollectionManager(collection_name)
+    def __init__(
+        self,
+        collection_name="table_rf_docs",
+        model_name="llama3:latest",
+        enable_answer_cache=False,
+        answer_cache_threshold=0.95,
+        embedding_backend=None,
+        use_vector_index=False,
+        context_token_budget=1500,
+        source_token_budget=300
+    ):
+        # torch / onnx / onnx-int8; None uses EMBEDDING_BACKEND
+        self.embedder = get_embedder("all-MiniLM-L6-v2", embedding_backend)
+        self.embedding_cache = get_embedding_cache(
+            cache_namespace("all-MiniLM-L6-v2", embedding_backend),
+            self.embedder.get_sentence_embedding_dimension()
+        )
+        self.query_cache = QueryEmbeddingCache(max_size=1024, ttl_seconds=3600)
+        self.collection_name = collection_name
+        # Exact in-process memmap index instead of querying through the Chroma client
+        self.use_vector_index = use_vector_index
+        self.collection = CollectionManager(collection_name, use_vector_index=use_vector_index)
         self.model_name = model_name
+        # Dedupe retrieved docs and trim them to a token budget (None: send them whole)
+        self.prompt_builder = PromptBuilder(
+            lambda texts: self.embedding_cache.encode(texts, self.embedder.encode),
+            self.embedder.encode,
+            max_context_tokens=context_token_budget,
+            max_source_tokens=source_token_budget
+        ) if context_token_budget else None
+        # Optional semantic cache: near-duplicate queries over the same docs reuse an answer
+        self.answer_cache = SemanticAnswerCache(
+            threshold=answer_cache_threshold
+        ) if enable_answer_cache else None
         
         # Verify collection has data
         count = self.collection.collection.count()
         print(f"Collection '{collection_name}' has {count} documents")
 
+    def reload_collection(self):
+        """
+        Re-resolve the collection alias after an index swap. The embedder and
+        caches are kept; queries already running finish on the old collection.
+        """
+        self.collection = CollectionManager(self.collection_name, use_vector_index=self.use_vector_index)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+        return self.collection.name
+
     def ask(self, user_query, top_k=10):
-        # 1. Embed query
-        query_embedding = self.embedder.encode(user_query).tolist()
+        # 1. Embed query (the in-memory query cache only: queries never go into the
+        #    persistent embedding cache, which holds ingested chunk vectors)
+        query_embedding = self.query_cache.get_or_compute(
+            user_query,
+            lambda q: self.embedder.encode([q])[0].tolist()
+        )
         print(f"Query: {user_query}")
 
         # 2. Retrieve top-k docs
@@ -26,7 +75,20 @@ class FileWiseRAG:
         if not raw_results or len(raw_results) == 0:
             return " No relevant documents found.", []
 
-        # 3. Prepare file-name-wise context
+        signature = doc_signature(raw_results)
+        if self.answer_cache is not None:
+            cached = self.answer_cache.lookup(query_embedding, signature)
+            if cached is not None:
+                print(f"Answer cache hit (similarity {cached['similarity']:.3f})")
+                return cached["answer"], raw_results
+
+        # 3. Prepare file-name-wise context, within the token budget
+        if self.prompt_builder is not None:
+            raw_results, context_stats = self.prompt_builder.build(query_embedding, raw_results)
+            print(f"Context tokens: {context_stats['context_tokens_before']} -> "
+                  f"{context_stats['context_tokens_after']} "
+                  f"(saved {context_stats['tokens_saved']}, "
+                  f"{context_stats['duplicates_removed']} duplicates removed)")
         context_text = "\n\n".join(
             [f"File: {d.get('metadata', {}).get('filename', 'Unknown')}\nContent: {d.get('document', '')}" 
              for d in raw_results]
@@ -42,7 +104,11 @@ class FileWiseRAG:
             ]
         )
 
-        return response["message"]["content"], raw_results
+        answer = response["message"]["content"]
+        if self.answer_cache is not None:
+            self.answer_cache.store(query_embedding, signature, {"answer": answer})
+
+        return answer, raw_results
 
 
 # Example usage
@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from config.registry import DEFAULT_RERANKER_MODEL, get_cross_encoder
+
+
+class Reranker:
+    """
+    Cross-encoder rerank stage between retrieval and the prompt.
+
+    Retrieval fetches a wide candidate set (candidates); the cross-encoder
+    scores every (query, chunk) pair in batches on the CPU and only the best
+    top_n go on to the LLM. The stage has a latency budget: when the
+    expected time (from a running average of per-pair cost) exceeds
+    budget_seconds, or the budget runs out between batches, the candidates
+    keep their retrieval order instead.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_RERANKER_MODEL,
+        candidates: int = 20,
+        budget_seconds: float = 0.3,
+        batch_size: int = 16,
+        max_chars: int = 2000
+    ):
+        self.model_name = model_name
+        self.model = get_cross_encoder(model_name)
+        self.candidates = candidates
+        self.budget_seconds = budget_seconds
+        self.batch_size = batch_size
+        # The model only sees ~512 tokens anyway; don't tokenize more than that
+        self.max_chars = max_chars
+        self._pair_seconds = None
+        self._lock = threading.Lock()
+        self.reranked = 0
+        self.fallbacks = 0
+
+    def warm_up(self):
+        """First predict pays for kernel/tokenizer setup; keep it out of the average"""
+        self.model.predict([("warmup", "warmup")], show_progress_bar=False)
+
+    def _observe(self, pairs: int, seconds: float):
+        with self._lock:
+            per_pair = seconds / pairs
+            self._pair_seconds = per_pair if self._pair_seconds is None else (
+                0.8 * self._pair_seconds + 0.2 * per_pair
+            )
+
+    def _fallback(self, sources: List[Dict], top_n: int, info: Dict, status: str):
+        with self._lock:
+            self.fallbacks += 1
+        info["status"] = status
+        return sources[:top_n], info
+
+    def rerank(self, query: str, sources: List[Dict], top_n: int) -> Tuple[List[Dict], Dict]:
+        """
+        Return (best top_n sources, info). Reranked sources are copies with a
+        "rerank_score"; ranks are renumbered to the new order.
+        """
+        start = time.perf_counter()
+        info = {
+            "model": self.model_name,
+            "candidates": len(sources),
+            "budget_seconds": self.budget_seconds
+        }
+        if len(sources) <= 1:
+            info.update(status="skipped", seconds=0.0)
+            return sources[:top_n], info
+
+        expected = self._pair_seconds * len(sources) if self._pair_seconds is not None else 0.0
+        if expected > self.budget_seconds:
+            with self._lock:
+                # Decay the estimate so one slow spell doesn't disable reranking for good
+                self._pair_seconds *= 0.9
+            info["expected_seconds"] = expected
+            info["seconds"] = time.perf_counter() - start
+            return self._fallback(sources, top_n, info, "over_budget")
+
+        pairs = [(query, s["document"][:self.max_chars]) for s in sources]
+        scores = []
+        for i in range(0, len(pairs), self.batch_size):
+            if i and time.perf_counter() - start > self.budget_seconds:
+                info["seconds"] = time.perf_counter() - start
+                return self._fallback(sources, top_n, info, "budget_exceeded")
+            batch = pairs[i:i + self.batch_size]
+            batch_start = time.perf_counter()
+            scores.extend(float(x) for x in self.model.predict(
+                batch, batch_size=self.batch_size, show_progress_bar=False
+            ))
+            self._observe(len(batch), time.perf_counter() - batch_start)
+
+        info["seconds"] = time.perf_counter() - start
+
+        order = sorted(range(len(sources)), key=lambda i: scores[i], reverse=True)[:top_n]
+        reranked = []
+        for new_rank, i in enumerate(order, start=1):
+            source = dict(sources[i], rerank_score=scores[i])
+            if "rank" in source:
+                source["retrieval_rank"] = source["rank"]
+                source["rank"] = new_rank
+                source["relevance_note"] = f"Source {new_rank}"
+            reranked.append(source)
+
+        with self._lock:
+            self.reranked += 1
+        info["status"] = "reranked"
+        return reranked, info
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "candidates": self.candidates,
+                "budget_seconds": self.budget_seconds,
+                "reranked": self.reranked,
+                "fallbacks": self.fallbacks,
+                "avg_pair_ms": self._pair_seconds * 1000 if self._pair_seconds is not None else None
+            }
@@ -0,0 +1,344 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+logger = logging.getLogger(__name__)
+
+
+class SessionBackend(ABC):
+    """
+    Storage interface for session metadata, chat messages, memory state and
+    per-turn traces.
+
+    The agent keeps a per-process cache in front of it; a persistent backend
+    lets any worker (or a restarted process) serve any session_id. Traces
+    are append-only and kept apart from the session metadata, so saving a
+    session never rewrites its whole trace history.
+    """
+
+    persistent = False
+
+    @abstractmethod
+    def load_session(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def save_session(self, session_id: str, session: Dict):
+        ...
+
+    @abstractmethod
+    def delete_session(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def delete_idle_sessions(self, idle_seconds: float) -> int:
+        ...
+
+    @abstractmethod
+    def load_messages(self, session_id: str) -> List[BaseMessage]:
+        ...
+
+    @abstractmethod
+    def append_messages(self, session_id: str, messages: List[BaseMessage]):
+        ...
+
+    @abstractmethod
+    def clear_messages(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def load_state(self, session_id: str) -> Dict:
+        ...
+
+    @abstractmethod
+    def save_state(self, session_id: str, state: Dict):
+        ...
+
+    @abstractmethod
+    def load_traces(self, session_id: str) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def append_trace(self, session_id: str, trace: Dict):
+        ...
+
+    @abstractmethod
+    def clear_traces(self, session_id: str):
+        ...
+
+    def flush(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    SQLite backend in WAL mode, shareable by every uvicorn worker on a box.
+
+    Writes are queued and committed in batches (one transaction per batch)
+    by a background thread every flush_interval seconds or once batch_size
+    operations are pending, so a request pays for a queue append rather than
+    an fsync. Reads flush pending writes first, so a worker always reads its
+    own writes.
+
+    A batch that fails to commit (e.g. "database is locked" while another
+    worker holds the write lock) goes back to the head of the queue and is
+    retried on the next flush. After max_retries consecutive failures it is
+    dropped and counted in stats()["dropped_writes"], so a poison write
+    can't block the queue forever.
+    """
+
+    persistent = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id);
+    CREATE TABLE IF NOT EXISTS states (
+        session_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS traces (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_traces_session ON traces(session_id, id);
+    """
+
+    TABLES = ("sessions", "messages", "states", "traces")
+
+    def __init__(self, path: str = "./sessions.db", batch_size: int = 64, flush_interval: float = 0.05,
+                 max_retries: int = 5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._attempts = 0
+        self.failed_flushes = 0
+        self.dropped_writes = 0
+
+        self._local = threading.local()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+        conn.commit()
+
+        self._writer = threading.Thread(target=self._writer_loop, name="session-writer", daemon=True)
+        self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside the writer"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # -- batched writes ----------------------------------------------------------
+
+    def _enqueue(self, sql: str, params: tuple):
+        with self._pending_lock:
+            self._pending.append((sql, params))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Commit every pending write in one transaction"""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            conn = self._conn()
+            try:
+                with conn:
+                    for sql, params in batch:
+                        conn.execute(sql, params)
+            except Exception as e:
+                self.failed_flushes += 1
+                self._attempts += 1
+                if self._attempts > self.max_retries:
+                    self._attempts = 0
+                    self.dropped_writes += len(batch)
+                    logger.error(f"Dropping {len(batch)} session operations after "
+                                 f"{self.max_retries} retries: {e}")
+                else:
+                    with self._pending_lock:
+                        # Ahead of anything queued meanwhile, so writes keep their order
+                        self._pending[:0] = batch
+                    logger.warning(f"Failed to write {len(batch)} session operations "
+                                   f"(attempt {self._attempts}), will retry: {e}")
+                raise
+            self._attempts = 0
+
+    def _writer_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # already logged; the batch was requeued or counted as dropped
+
+    def stats(self) -> Dict:
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "path": self.path,
+            "pending_writes": pending,
+            "failed_flushes": self.failed_flushes,
+            "dropped_writes": self.dropped_writes
+        }
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._writer.join(timeout=5)
+        self.flush()
+
+    # -- sessions ------------------------------------------------------------------
+
+    def load_session(self, session_id):
+        self.flush()
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_session(self, session_id, session):
+        # Traces live in their own append-only table
+        session = {key: value for key, value in session.items() if key != "trace_log"}
+        self._enqueue(
+            "INSERT INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (session_id, json.dumps(session, default=str), time.time())
+        )
+
+    def delete_session(self, session_id):
+        for table in self.TABLES:
+            self._enqueue(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+
+    def delete_idle_sessions(self, idle_seconds):
+        self.flush()
+        cutoff = time.time() - idle_seconds
+        conn = self._conn()
+        idle = [row[0] for row in conn.execute(
+            "SELECT session_id FROM sessions WHERE updated_at < ?", (cutoff,)
+        )]
+        with conn:
+            for session_id in idle:
+                for table in self.TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        return len(idle)
+
+    # -- messages ------------------------------------------------------------------
+
+    def load_messages(self, session_id):
+        self.flush()
+        rows = self._conn().execute(
+            "SELECT data FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def append_messages(self, session_id, messages):
+        for message in messages_to_dict(messages):
+            self._enqueue(
+                "INSERT INTO messages (session_id, data) VALUES (?, ?)",
+                (session_id, json.dumps(message))
+            )
+
+    def clear_messages(self, session_id):
+        self._enqueue("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    # -- memory state ---------------------------------------------------------------
+
+    def load_state(self, session_id):
+        self.flush()
+        row = self._conn().execute(
+            "SELECT data FROM states WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def save_state(self, session_id, state):
+        self._enqueue(
+            "INSERT INTO states (session_id, data) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data",
+            (session_id, json.dumps(state))
+        )
+
+    # -- traces ----------------------------------------------------------------------
+
+    def load_traces(self, session_id):
+        self.flush()
+        rows = self._conn().execute(
+            "SELECT data FROM traces WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def append_trace(self, session_id, trace):
+        self._enqueue(
+            "INSERT INTO traces (session_id, data) VALUES (?, ?)",
+            (session_id, json.dumps(trace, default=str))
+        )
+
+    def clear_traces(self, session_id):
+        self._enqueue("DELETE FROM traces WHERE session_id = ?", (session_id,))
+
+
+class StoredChatMessageHistory(BaseChatMessageHistory):
+    """Chat history cached in process and written through to a SessionBackend"""
+
+    def __init__(self, session_id: str, backend: SessionBackend, messages: Optional[List[BaseMessage]] = None):
+        self.session_id = session_id
+        self.backend = backend
+        self._messages: List[BaseMessage] = list(messages or [])
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self._messages
+
+    def add_messages(self, messages) -> None:
+        messages = list(messages)
+        self._messages.extend(messages)
+        self.backend.append_messages(self.session_id, messages)
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def reload(self):
+        self._messages = self.backend.load_messages(self.session_id)
+
+    def clear(self) -> None:
+        self._messages = []
+        self.backend.clear_messages(self.session_id)
@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config.ulid import new_ulid
+from session_backends import SessionBackend
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLocks:
+    """
+    Per-session locks that serialize turns within one session while
+    different sessions run fully in parallel.
+
+    hold() is for threads, ahold() for coroutines; both guard the same
+    underlying lock, so a sync and an async turn on one session still
+    exclude each other. Async waiters queue on an asyncio.Lock first, so
+    only one of them per session parks an executor thread. Locks are
+    reference counted and dropped once nobody holds or waits for them.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Dict] = {}
+        self._guard = threading.Lock()
+
+    def _checkout(self, session_id: str) -> Dict:
+        with self._guard:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                entry = self._entries[session_id] = {
+                    "lock": threading.Lock(), "async_lock": None, "refs": 0
+                }
+            entry["refs"] += 1
+            return entry
+
+    def _checkin(self, session_id: str):
+        with self._guard:
+            entry = self._entries[session_id]
+            entry["refs"] -= 1
+            if entry["refs"] == 0:
+                del self._entries[session_id]
+
+    @contextmanager
+    def hold(self, session_id: Optional[str]):
+        # No id yet means a brand-new session nobody else can address
+        if session_id is None:
+            yield
+            return
+        entry = self._checkout(session_id)
+        try:
+            with entry["lock"]:
+                yield
+        finally:
+            self._checkin(session_id)
+
+    @asynccontextmanager
+    async def ahold(self, session_id: Optional[str]):
+        if session_id is None:
+            yield
+            return
+        entry = self._checkout(session_id)
+        try:
+            with self._guard:
+                if entry["async_lock"] is None:
+                    entry["async_lock"] = asyncio.Lock()
+            async with entry["async_lock"]:
+                lock = entry["lock"]
+                if not lock.acquire(blocking=False):
+                    # Held by a sync turn: wait on a worker thread, not the event loop
+                    waiter = asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+                    try:
+                        await asyncio.shield(waiter)
+                    except asyncio.CancelledError:
+                        waiter.add_done_callback(lambda _: lock.release())
+                        raise
+                try:
+                    yield
+                finally:
+                    lock.release()
+        finally:
+            self._checkin(session_id)
+
+    def __len__(self) -> int:
+        with self._guard:
+            return len(self._entries)
+
+
+class SessionStore:
+    """
+    Dict-like store for session metadata with idle TTL and an LRU cap.
+
+    - Reading a session (store[session_id]) marks it as recently used.
+    - Sessions idle longer than idle_ttl_seconds expire; expired entries are
+      dropped lazily on access and by a background sweeper thread.
+    - When more than max_sessions exist the least recently used is evicted.
+
+    on_evict(session_id, reason) is called for every removal so owners can
+    free whatever else they keep per session (chat history, summaries, ...).
+
+    With a persistent backend this store is a per-process cache: sessions
+    missing locally are loaded from the backend, save() writes changes
+    through, LRU/TTL eviction only drops the local copy, and explicit
+    deletes (plus backend rows idle past the TTL) are removed for everyone.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        idle_ttl_seconds: float = 3600,
+        sweep_interval_seconds: float = 60,
+        on_evict: Optional[Callable[[str, str], None]] = None,
+        backend: Optional[SessionBackend] = None
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.on_evict = on_evict
+        self.backend = backend
+
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+        self.evicted_lru = 0
+        self.expired_ttl = 0
+        self.deleted = 0
+
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    # -- dict protocol -------------------------------------------------------
+
+    def _expired(self, session_id: str, now: float) -> bool:
+        return bool(self.idle_ttl_seconds) and (
+            now - self._last_access.get(session_id, now) > self.idle_ttl_seconds
+        )
+
+    def __contains__(self, session_id) -> bool:
+        with self._lock:
+            if session_id in self._sessions and self._expired(session_id, time.monotonic()):
+                self._remove(session_id, "ttl")
+            if session_id in self._sessions:
+                return True
+            # Another worker (or an earlier process) may own it
+            return self._load_from_backend(session_id)
+
+    def _load_from_backend(self, session_id: str) -> bool:
+        if self.backend is None or not self.backend.persistent:
+            return False
+        session = self.backend.load_session(session_id)
+        if session is None:
+            return False
+        self._put_local(session_id, session)
+        return True
+
+    def _put_local(self, session_id: str, session: Dict):
+        self._sessions[session_id] = session
+        self.touch(session_id)
+        while len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions))
+            self._remove(oldest, "lru")
+
+    def __getitem__(self, session_id: str) -> Dict:
+        with self._lock:
+            if session_id not in self:
+                raise KeyError(session_id)
+            self.touch(session_id)
+            return self._sessions[session_id]
+
+    def get(self, session_id: str, default=None):
+        try:
+            return self[session_id]
+        except KeyError:
+            return default
+
+    def __setitem__(self, session_id: str, session: Dict):
+        with self._lock:
+            self._put_local(session_id, session)
+            if self.backend is not None:
+                self.backend.save_session(session_id, session)
+
+    def save(self, session_id: str):
+        """Write a session's (mutated) metadata through to the backend"""
+        if self.backend is None:
+            return
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is not None:
+            self.backend.save_session(session_id, session)
+
+    def refresh(self, session_id: str):
+        """Reload a session from a persistent backend (another worker may have updated it)"""
+        if self.backend is None or not self.backend.persistent:
+            return
+        session = self.backend.load_session(session_id)
+        with self._lock:
+            if session is not None and session_id in self._sessions:
+                self._sessions[session_id].clear()
+                self._sessions[session_id].update(session)
+
+    # -- traces ----------------------------------------------------------------
+
+    def append_trace(self, session_id: str, trace: Dict):
+        """Record a turn's trace (an append-only row with a backend, in the session without)"""
+        if self.backend is not None:
+            self.backend.append_trace(session_id, trace)
+            return
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.setdefault("trace_log", []).append(trace)
+
+    def traces(self, session_id: str) -> List[Dict]:
+        if self.backend is not None:
+            return self.backend.load_traces(session_id)
+        with self._lock:
+            return list(self._sessions.get(session_id, {}).get("trace_log", []))
+
+    def clear_traces(self, session_id: str):
+        if self.backend is not None:
+            self.backend.clear_traces(session_id)
+            return
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session["trace_log"] = []
+
+    def __delitem__(self, session_id: str):
+        with self._lock:
+            if session_id not in self._sessions:
+                raise KeyError(session_id)
+            self._remove(session_id, "deleted")
+
+    def pop(self, session_id: str, default=None):
+        with self._lock:
+            if session_id not in self:
+                return default
+            session = self._sessions[session_id]
+            self._remove(session_id, "deleted")
+            return session
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions.keys())
+
+    def values(self) -> List[Dict]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        with self._lock:
+            return list(self._sessions.items())
+
+    # -- lifecycle -------------------------------------------------------------
+
+    def touch(self, session_id: str):
+        with self._lock:
+            self._last_access[session_id] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+
+    def _remove(self, session_id: str, reason: str):
+        self._sessions.pop(session_id, None)
+        self._last_access.pop(session_id, None)
+
+        if reason == "lru":
+            self.evicted_lru += 1
+        elif reason == "ttl":
+            self.expired_ttl += 1
+        else:
+            self.deleted += 1
+            if self.backend is not None:
+                self.backend.delete_session(session_id)
+
+        if self.on_evict is not None:
+            try:
+                self.on_evict(session_id, reason)
+            except Exception as e:
+                logger.warning(f"Session eviction callback failed for {session_id}: {e}")
+
+    def sweep(self) -> int:
+        """Drop every session idle longer than the TTL; returns how many expired"""
+        now = time.monotonic()
+        with self._lock:
+            # Entries are in LRU order, so expired ones are all at the front
+            expired = []
+            for session_id in self._sessions:
+                if not self._expired(session_id, now):
+                    break
+                expired.append(session_id)
+            for session_id in expired:
+                self._remove(session_id, "ttl")
+
+        if self.backend is not None and self.backend.persistent and self.idle_ttl_seconds:
+            # Rows nobody touched within the TTL are gone for every worker
+            self.backend.delete_idle_sessions(self.idle_ttl_seconds)
+
+        if expired:
+            logger.info(f"🧹 Expired {len(expired)} idle sessions")
+        return len(expired)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval_seconds):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"Session sweep failed: {e}")
+
+    def start_sweeper(self):
+        if self._sweeper is not None or not self.idle_ttl_seconds:
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop, name="session-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active = len(self._sessions)
+        return {
+            "active_sessions": active,
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "evicted_lru": self.evicted_lru,
+            "expired_ttl": self.expired_ttl,
+            "deleted": self.deleted,
+            "evictions_total": self.evicted_lru + self.expired_ttl
+        }
@@ -0,0 +1,154 @@
+"""
+Recall@k drift and throughput of the embedding backends against the float model.
+
+Chunks the docs exactly like DocLoader, embeds chunks and queries with the
+reference backend (torch float32) and each candidate backend, and reports:
+
+  - recall@k: overlap of the candidate's top-k chunks with the reference
+    top-k, both when the whole index is rebuilt with the candidate ("full")
+    and when only queries use it against a float index ("query-only")
+  - cosine agreement between candidate and reference vectors
+  - corpus (batched) and single-query encode throughput
+
+    python verify_embeddings.py --docs-dir ./docs --backends onnx onnx-int8 --min-recall 0.9
+
+Queries come from --queries (one per line) or, by default, from the docs'
+section headings. Exits non-zero if any recall@k falls below --min-recall.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from config.chunker import MarkdownChunker
+from config.registry import get_embedder, get_tokenizer
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def load_chunks(docs_dir, tokenizer, chunk_tokens, chunk_overlap):
+    chunker = MarkdownChunker(max_tokens=chunk_tokens, overlap_tokens=chunk_overlap, tokenizer=tokenizer)
+    chunks = []
+    for root, _, files in os.walk(docs_dir):
+        for filename in sorted(f for f in files if f.endswith(".md")):
+            with open(os.path.join(root, filename), "r", encoding="utf-8") as f:
+                text = f.read().strip()
+            if text:
+                chunks.extend(chunker.chunk(text))
+    return chunks
+
+
+def load_queries(path, chunks, max_queries):
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        # Section headings read like the questions people ask about them
+        queries = list(dict.fromkeys(c["heading"] for c in chunks if c.get("heading")))
+        if not queries:
+            queries = [" ".join(c["text"].split()[:12]) for c in chunks]
+    return queries[:max_queries]
+
+
+def encode(model, texts, batch_size):
+    return np.asarray(
+        model.encode(texts, batch_size=batch_size, normalize_embeddings=True), dtype=np.float32
+    )
+
+
+def top_k(queries, corpus, k):
+    scores = queries @ corpus.T
+    k = min(k, corpus.shape[0])
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def recall_at_k(candidate, reference):
+    k = reference.shape[1]
+    return float(np.mean([
+        len(set(c) & set(r)) / k for c, r in zip(candidate.tolist(), reference.tolist())
+    ]))
+
+
+def measure(model, chunk_texts, queries, batch_size, speed_queries):
+    start = time.perf_counter()
+    corpus = encode(model, chunk_texts, batch_size)
+    corpus_rate = len(chunk_texts) / (time.perf_counter() - start)
+
+    query_vectors = encode(model, queries, batch_size)
+
+    # Serving embeds one query per request
+    sample = queries[:speed_queries]
+    start = time.perf_counter()
+    for query in sample:
+        encode(model, [query], 1)
+    query_rate = len(sample) / (time.perf_counter() - start)
+    return corpus, query_vectors, corpus_rate, query_rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs-dir", default="./docs")
+    parser.add_argument("--reference", default="torch", help="Backend treated as ground truth")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--queries", default=None, help="File with one query per line")
+    parser.add_argument("--max-queries", type=int, default=500)
+    parser.add_argument("--speed-queries", type=int, default=100, help="Queries timed one at a time")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--chunk-tokens", type=int, default=200)
+    parser.add_argument("--chunk-overlap", type=int, default=32)
+    parser.add_argument("--min-recall", type=float, default=None, help="Fail below this recall@k")
+    args = parser.parse_args()
+
+    reference_model = get_embedder(MODEL_NAME, args.reference)
+    chunks = load_chunks(
+        args.docs_dir, get_tokenizer(MODEL_NAME, args.reference).tokenize,
+        args.chunk_tokens, args.chunk_overlap
+    )
+    if not chunks:
+        print(f"No markdown chunks found under {args.docs_dir}")
+        sys.exit(1)
+    chunk_texts = [c["text"] for c in chunks]
+    queries = load_queries(args.queries, chunks, args.max_queries)
+    print(f"📚 {len(chunk_texts)} chunks, {len(queries)} queries")
+
+    ref_corpus, ref_queries, ref_corpus_rate, ref_query_rate = measure(
+        reference_model, chunk_texts, queries, args.batch_size, args.speed_queries
+    )
+    reference_top = {k: top_k(ref_queries, ref_corpus, k) for k in args.k}
+
+    print(f"\n{'='*78}")
+    print(f"{'backend':<12} {'corpus/s':>9} {'query/s':>9} {'cos mean':>9} {'cos min':>8}  recall@k (full | query-only)")
+    print(f"{'='*78}")
+    print(f"{args.reference:<12} {ref_corpus_rate:>9.1f} {ref_query_rate:>9.1f} {1.0:>9.4f} {1.0:>8.4f}  reference")
+
+    failed = False
+    for backend in args.backends:
+        model = get_embedder(MODEL_NAME, backend)
+        corpus, query_vectors, corpus_rate, query_rate = measure(
+            model, chunk_texts, queries, args.batch_size, args.speed_queries
+        )
+
+        agreement = np.sum(corpus * ref_corpus, axis=1)
+        recalls = []
+        for k in args.k:
+            full = recall_at_k(top_k(query_vectors, corpus, k), reference_top[k])
+            query_only = recall_at_k(top_k(query_vectors, ref_corpus, k), reference_top[k])
+            recalls.append(f"@{k} {full:.3f} | {query_only:.3f}")
+            if args.min_recall is not None and min(full, query_only) < args.min_recall:
+                failed = True
+
+        print(
+            f"{backend:<12} {corpus_rate:>9.1f} {query_rate:>9.1f} "
+            f"{agreement.mean():>9.4f} {agreement.min():>8.4f}  {', '.join(recalls)}"
+        )
+        print(
+            f"{'':<12} speedup: corpus x{corpus_rate / ref_corpus_rate:.2f}, "
+            f"query x{query_rate / ref_query_rate:.2f}"
+        )
+
+    if failed:
+        print(f"❌ recall below {args.min_recall}")
+    sys.exit(1 if failed else 0)
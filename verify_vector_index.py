@@ -0,0 +1,101 @@
+"""
+Parity and latency of the in-process memmap vector index against Chroma.
+
+Exports the collection (config/vector_index.py), queries both with
+perturbed stored vectors (near-neighbour queries with known answers) and
+reports:
+
+  - how often the ranked top-k ids are identical, and how much of Chroma's
+    top-k the exact search finds (Chroma's HNSW is approximate, so exact
+    search may legitimately differ)
+  - the largest difference between the distances both report
+  - single-query and batched latency of each
+
+    python verify_vector_index.py --collection table_rf_docs --min-overlap 0.95
+
+Needs an indexed collection (python index_docs.py). Exits non-zero if the
+top-k overlap falls below --min-overlap, so CI can run it after indexing.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from config.collection_manager import CollectionManager
+from config.vector_index import MemmapVectorIndex
+
+
+def perturbed_queries(index, count, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(index), size=min(count, len(index)), replace=False)
+    queries = np.asarray(index.vectors[sample]) + rng.normal(0, noise, (len(sample), index.dim)).astype(np.float32)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).tolist()
+
+
+def timed_per_query(fn, queries):
+    start = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def compare(chroma_results, memmap_results, top_k):
+    exact, overlap, max_score_diff = 0, 0.0, 0.0
+    for chroma, mine in zip(chroma_results, memmap_results):
+        theirs = chroma["ids"][0]
+        ours = {r["id"]: r["score"] for r in mine}
+        exact += theirs == list(ours)
+        overlap += len(set(theirs) & set(ours)) / top_k
+        for their_id, their_distance in zip(theirs, chroma["distances"][0]):
+            if their_id in ours:
+                max_score_diff = max(max_score_diff, abs(ours[their_id] - their_distance))
+    return exact / len(chroma_results), overlap / len(chroma_results), max_score_diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="table_rf_docs")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.05, help="Std-dev added to the sampled vectors")
+    parser.add_argument("--min-overlap", type=float, default=0.95, help="Fail below this top-k overlap")
+    args = parser.parse_args()
+
+    collection = CollectionManager(args.collection).collection
+    index = MemmapVectorIndex.build(collection)
+    if len(index) == 0:
+        print("Collection is empty, nothing to compare")
+        sys.exit(1)
+
+    top_k = args.top_k
+    queries = perturbed_queries(index, args.queries, args.noise)
+
+    chroma_results, chroma_single = timed_per_query(
+        lambda q: collection.query(query_embeddings=[q], n_results=top_k, include=["distances"]), queries
+    )
+    memmap_results, memmap_single = timed_per_query(lambda q: index.query(q, top_k), queries)
+
+    start = time.perf_counter()
+    collection.query(query_embeddings=queries, n_results=top_k, include=["distances"])
+    chroma_batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.query_batch(queries, top_k)
+    memmap_batch_seconds = time.perf_counter() - start
+
+    exact, overlap, max_score_diff = compare(chroma_results, memmap_results, top_k)
+
+    print(f"\n{'='*60}")
+    print(f"Parity over {len(queries)} queries, top_k={top_k}, {len(index)} vectors")
+    print(f"Identical ranked ids: {exact:.1%}")
+    print(f"Chroma top-k found by exact search: {overlap:.1%}")
+    print(f"Max |distance difference|: {max_score_diff:.2e}")
+    print(f"{'='*60}")
+    print(f"Single query: chroma {chroma_single * 1e3:.2f}ms, memmap {memmap_single * 1e3:.2f}ms "
+          f"(x{chroma_single / memmap_single:.1f})")
+    print(f"Batch of {len(queries)}: chroma {chroma_batch_seconds * 1e3:.1f}ms, "
+          f"memmap {memmap_batch_seconds * 1e3:.1f}ms (x{chroma_batch_seconds / memmap_batch_seconds:.1f})")
+
+    if overlap < args.min_overlap:
+        print(f"❌ top-k overlap below {args.min_overlap}")
+    sys.exit(1 if overlap < args.min_overlap else 0)